@@ -15,6 +15,12 @@ Date: 2018/04/11 08:24:31
 import sys
 import time
 import freq_patt_tree as fp
+import eclat
+import partition
+import itemset_store
+import bitmap
+import instrument
+import loader
 from itertools import chain, combinations
 from collections import defaultdict
 
@@ -41,10 +47,41 @@ def join_itemsets_with_fixed_elem_size(itemsets, elem_size):
                     subset = frozenset(elem)
                     if subset not in itemsets:
                         pruned = True
+                        break
                 if not pruned:
                     joint_itemsets.add(candidate)
     return joint_itemsets
 
+def join_itemsets_with_common_prefix(itemsets, elem_size):
+    """
+        apriori-gen, same candidates as join_itemsets_with_fixed_elem_size
+
+        Itemsets are taken as sorted tuples and only pairs sharing their first
+        elem_size - 2 items are joined, then a candidate is dropped at its
+        first (elem_size - 1)-subset missing from itemsets. Items must be
+        mutually orderable.
+    """
+    prefix_dict = defaultdict(list) # key: sorted prefix val: last items
+    for itemset in itemsets:
+        if len(itemset) == elem_size - 1:
+            elems = tuple(sorted(itemset))
+            prefix_dict[elems[:-1]].append(elems[-1])
+    joint_itemsets = set()
+    for prefix, last_items in prefix_dict.items():
+        last_items.sort()
+        for i in range(len(last_items)):
+            for j in range(i + 1, len(last_items)):
+                candidate = prefix + (last_items[i], last_items[j])
+                # subsets dropping either of the last two items are the joined pair
+                pruned = False
+                for k in range(len(prefix)):
+                    if frozenset(candidate[:k] + candidate[k + 1:]) not in itemsets:
+                        pruned = True
+                        break
+                if not pruned:
+                    joint_itemsets.add(frozenset(candidate))
+    return joint_itemsets
+
 def generate_seed_itemsets_and_actionsets(data_iter):
     actionsets = list() # type list
     seed_itemsets = set() # type set
@@ -72,19 +109,47 @@ def get_support_itemsets(candidate_itemsets, actionsets, min_sup):
            update_dict[itemset] = count
     return itemsets, update_dict
 
-def load_file(fname):
-    fd = open(fname, 'r')
-    for line in fd:
-        line = line.strip().rstrip(',')
-        actionset = frozenset(line.split(','))
-        yield actionset
+def get_support_itemsets_bitmap(candidate_itemsets, tid_bitmaps, min_sup):
+    """
+        Same as get_support_itemsets, support is popcount of AND-ed tid bitmaps
+
+        Params:
+            tid_bitmaps: dict item -> tid bitmap, see bitmap.create_tid_bitmaps
+    """
+    itemsets = set()
+    update_dict = defaultdict(int)
+    for itemset in candidate_itemsets:
+        count = bitmap.popcount(bitmap.intersect(itemset, tid_bitmaps))
+        if count > 0 and count >= min_sup:
+            itemsets.add(itemset)
+            update_dict[itemset] = count
+    return itemsets, update_dict
 
-def dump(itemset, rules, to_file_only=False):
+def load_file(fname, vocab=None):
+    """
+        Params:
+            vocab: optional item_vocab.ItemVocab, yields int encoded actionsets
+    """
+    with open(fname, 'r') as fd:
+        for line in fd:
+            line = line.strip().rstrip(',')
+            actionset = frozenset(line.split(','))
+            if vocab is not None:
+                actionset = vocab.encode(actionset)
+            yield actionset
+
+def dump(itemset, rules, to_file_only=False, vocab=None):
+    """
+        Params:
+            vocab: optional item_vocab.ItemVocab to decode int encoded items
+    """
     fn_items = "out_large_itemsets.csv"
     fn_rules = "out_recom_rules.csv"
     fd_items = open(fn_items, 'w')
     fd_rules = open(fn_rules, 'w')
     for sup, items in sorted(itemset, key=lambda x: x[0]):
+        if vocab is not None:
+            items = vocab.decode(items)
         if to_file_only == False:
             print("Itemset: {} support: {:.3f}".format(items, sup))
         fd_items.write(str(sup) + ',')
@@ -93,6 +158,8 @@ def dump(itemset, rules, to_file_only=False):
     fd_items.close()
     for con, rule in sorted(rules, key=lambda x: x[0]):
         items, recom = rule
+        if vocab is not None:
+            items, recom = vocab.decode(items), vocab.decode(recom)
         if to_file_only == False:
             print("Rule: {} => {} confidence: {:.3f}".format(items, recom, con))
         fd_rules.write(str(con) + ',')
@@ -101,14 +168,46 @@ def dump(itemset, rules, to_file_only=False):
         fd_rules.write('\n')
     fd_rules.close()
 
-def compute_large_itemsets(seed_itemsets, actionsets, min_support, max_large_item_len=None):
+def compute_large_itemsets(seed_itemsets, actionsets, min_support, max_large_item_len=None,
+    counting="naive", candidate_gen="prefix"):
+    """
+        Level-wise apriori
+
+        Params:
+            candidate_gen: "prefix" joins itemsets sharing a sorted prefix,
+                "pairwise" unions every pair of itemsets
+            counting: "naive" tests every candidate against every actionset,
+                "bitmap" counts by popcount of AND-ed per item tid bitmaps
+    """
     support_dict = defaultdict(int)
     large_itemsets_dict = dict() # key: length val: set of itemset
+    if counting == "bitmap":
+        tid_bitmaps = bitmap.create_tid_bitmaps(actionsets)
+        get_support = lambda candidates, min_sup: get_support_itemsets_bitmap(
+            candidates, tid_bitmaps, min_sup)
+    elif counting == "naive":
+        get_support = lambda candidates, min_sup: get_support_itemsets(
+            candidates, actionsets, min_sup)
+    else:
+        raise ValueError("unknown counting: {}".format(counting))
+    if candidate_gen == "prefix":
+        join_itemsets = join_itemsets_with_common_prefix
+    elif candidate_gen == "pairwise":
+        join_itemsets = join_itemsets_with_fixed_elem_size
+    else:
+        raise ValueError("unknown candidate_gen: {}".format(candidate_gen))
+    inst = instrument.get()
     # seeding
-    print('seeding support itemset..')
-    seed_sup_itemsets, update_dict = get_support_itemsets(
-        seed_itemsets, actionsets, min_support)
-    print('seed support itemset: {}'.format(len(seed_sup_itemsets)))
+    with inst.phase("seed"):
+        seed_sup_itemsets, update_dict = get_support(seed_itemsets, min_support)
+    inst.count("candidates_generated", len(seed_itemsets))
+    inst.count("candidates_pruned", len(seed_itemsets) - len(seed_sup_itemsets))
+    if counting == "bitmap":
+        # only frequent items can appear in larger itemsets
+        for item in list(tid_bitmaps.keys()):
+            if frozenset([item]) not in seed_sup_itemsets:
+                del tid_bitmaps[item]
+    inst.event("level", size=1, candidates=len(seed_itemsets), large=len(seed_sup_itemsets))
     update_support_dict(support_dict, update_dict)
     # compute larget itemsets
     cur_large_itemsets = seed_sup_itemsets
@@ -117,91 +216,199 @@ def compute_large_itemsets(seed_itemsets, actionsets, min_support, max_large_ite
     while (len(cur_large_itemsets) != 0):
         large_itemsets_dict[cur_itemsets_size] = cur_large_itemsets
         cur_itemsets_size += 1
-        print('generating candidate items per sized: {}'.format(cur_itemsets_size))
-        candidate_itemsets = join_itemsets_with_fixed_elem_size(
-            cur_large_itemsets, cur_itemsets_size)
-        print('generated candidate itemset sized: {}'.format(len(candidate_itemsets)))
-        cur_large_itemsets, update_dict = get_support_itemsets(
-            candidate_itemsets, actionsets, min_support)
-        print('filtered support itemset sized: {}'.format(len(cur_large_itemsets)))
+        with inst.phase("candidate_gen"):
+            candidate_itemsets = join_itemsets(cur_large_itemsets, cur_itemsets_size)
+        with inst.phase("counting"):
+            cur_large_itemsets, update_dict = get_support(candidate_itemsets, min_support)
+        inst.count("candidates_generated", len(candidate_itemsets))
+        inst.count("candidates_pruned", len(candidate_itemsets) - len(cur_large_itemsets))
+        inst.event("level", size=cur_itemsets_size, candidates=len(candidate_itemsets),
+            large=len(cur_large_itemsets))
         update_support_dict(support_dict, update_dict)
         if max_large_item_len is not None and cur_itemsets_size == max_large_item_len:
             break
     return support_dict
 
-def load_support_dict(fname):
+def load_support_dict(fname, vocab=None):
+    """
+        Params:
+            fname: large itemsets csv, or itemset_store binary store
+    """
+    if itemset_store.is_store(fname, itemset_store.ITEMSETS):
+        return itemset_store.ItemsetStore(fname).to_support_dict(vocab)
     sup_dict = {}
     fd = open(fname, 'r')
     for line in fd:
         line = line.strip().rstrip(',')
         elems = line.split(',')
         actionset = frozenset(elems[1:])
+        if vocab is not None:
+            actionset = vocab.encode(actionset)
         sup = elems[0]
         sup_dict[actionset] = int(sup)
     return sup_dict
 
-def compute_recom_rules(support_dict, min_confidence, to_file_only=False, print_debug=False):
+def generate_itemset_rules(itemset, support, support_dict, min_confidence):
+    """
+        Rules X => Y with X | Y == itemset, ap-genrules style
+
+        Confidence only drops as items move from antecedent to consequent, so
+        consequents grow level-wise from the ones that passed and a failed
+        rule never has its smaller-antecedent rules tried.
+
+        Yield:
+            (confidence, (antecedent tuple, consequent tuple))
+    """
+    consequents = set([frozenset([item]) for item in itemset])
+    recom_size = 1
+    while len(consequents) > 0 and recom_size < len(itemset):
+        passed = set()
+        for recom_itemset in consequents:
+            subset = itemset.difference(recom_itemset)
+            confidence = 1.0 * support / support_dict[subset]
+            if confidence >= min_confidence:
+                passed.add(recom_itemset)
+                yield confidence, (tuple(subset), tuple(recom_itemset))
+        recom_size += 1
+        if recom_size >= len(itemset) or len(passed) < 2:
+            break
+        consequents = join_itemsets_with_common_prefix(passed, recom_size)
+
+def generate_recom_rules(support_dict, min_confidence):
+    """
+        Lazily yield every rule of support_dict passing min_confidence
+    """
+    for itemset, support in support_dict.items():
+        for rule in generate_itemset_rules(itemset, support, support_dict, min_confidence):
+            yield rule
+
+def compute_recom_rules(support_dict, min_confidence, to_file_only=False, print_debug=False, vocab=None):
+    """
+        Params:
+            support_dict: dict itemset -> support, or path accepted by load_support_dict
+    """
+    if isinstance(support_dict, str):
+        support_dict = load_support_dict(support_dict, vocab=vocab)
     fn_rules = "out_recom_rules.csv"
     fd_rules = None
     if to_file_only == True:
         fd_rules = open(fn_rules, 'w')
     recommendation_rules_with_confidence = []
+    inst = instrument.get()
     support_dict_len = len(support_dict)
+    # report progress about every percent of itemsets instead of every itemset
+    progress_step = max(1, support_dict_len // 100)
     iter_count = 0
     recom_count = 0
-    for itemset, support in support_dict.items():
-        sup_itemset = support
-        for sub in create_subset_generator(itemset):
-            subset = frozenset(sub)
-            if len(itemset) > len(subset):
-                sup_subset = support_dict[subset]
-                confidence = 1.0 * sup_itemset / sup_subset
-                if confidence >= min_confidence:
-                    recom_itemset = itemset.difference(subset)
-                    if print_debug == True:
-                        recom_count += 1
-                    if to_file_only == False:
-                        recommendation_rules_with_confidence.append(
-                            (confidence, (tuple(subset), tuple(recom_itemset))))
-                    else:
-                        fd_rules.write(str(confidence) + ',')
-                        fd_rules.write('|'.join(subset) + ',')
-                        fd_rules.write('|'.join(recom_itemset))
-                        fd_rules.write('\n')
-        if print_debug == True:
+    with inst.phase("rule_gen"):
+        for itemset, support in support_dict.items():
+            for confidence, rule in generate_itemset_rules(itemset, support, support_dict, min_confidence):
+                recom_count += 1
+                if to_file_only == False:
+                    recommendation_rules_with_confidence.append((confidence, rule))
+                else:
+                    subset, recom_itemset = rule
+                    if vocab is not None:
+                        subset, recom_itemset = vocab.decode(subset), vocab.decode(recom_itemset)
+                    fd_rules.write(str(confidence) + ',')
+                    fd_rules.write('|'.join(subset) + ',')
+                    fd_rules.write('|'.join(recom_itemset))
+                    fd_rules.write('\n')
             iter_count += 1
-            print("iter {}/{}".format(iter_count, support_dict_len))
-            print("recom total {}".format(recom_count))
+            if iter_count % progress_step == 0 or iter_count == support_dict_len:
+                inst.event("rule_progress", itemsets=iter_count, total=support_dict_len, rules=recom_count)
+                if print_debug == True:
+                    print("iter {}/{}, recom total {}".format(iter_count, support_dict_len, recom_count))
+    inst.count("rules_generated", recom_count)
     if fd_rules is not None:
         fd_rules.close()
     return recommendation_rules_with_confidence
 
 def run(data_iter, min_support, min_confidence, use_fp_tree=True, \
-    max_large_item_len=None, output_support_only=False, to_file_only=False, print_debug=False):
-    support_dict = {}
-    if max_large_item_len is not None:
-        use_fp_tree = False
-    if use_fp_tree == False:
-        print('generating seeding itemsets and actionsets..')
-        seed_itemsets, actionsets = generate_seed_itemsets_and_actionsets(data_iter)
-        print('generated seeding itemsets: {}, actionsets: {}'.format(len(seed_itemsets), len(actionsets)))
-        support_dict = compute_large_itemsets(seed_itemsets, actionsets, min_support, max_large_item_len=max_large_item_len)
-        if print_debug == True:
-            print('len(support_dict):', len(support_dict))
-    else:
-        root, header = fp.create_tree(data_iter, min_support)
-        support_dict = fp.compute_large_itemsets(root, header, min_support)
-        if print_debug == True:
-            print('len(support_dict):', len(support_dict))
+    max_large_item_len=None, output_support_only=False, to_file_only=False, print_debug=False, \
+    counting="naive", engine=None, diffset=False, vocab=None, workers=None, chunk_size=None, \
+    mode="all", top_k=None, instrumentation=None):
+    """
+        Mine large itemsets and recommendation rules
 
-    large_itemsets_with_support = []
-    recommendation_rules_with_confidence = []
+        Params:
+            data_iter: iterable of actionsets, loader.Transactions are mined as
+                item ids and decoded to names on output
+            vocab: item_vocab.ItemVocab of int encoded data_iter, used to
+                decode rules written by to_file_only
+            engine: "apriori", "fp_tree" or "eclat", defaults to use_fp_tree
+            diffset: eclat engine only, mine with diffsets (dEclat)
+            workers: fp_tree engine only, number of mining processes
+            mode: fp_tree engine only, "all", "closed" or "maximal" itemsets,
+                maximal itemsets lack subset supports and need output_support_only
+            top_k: fp_tree engine only, keep the k most supported itemsets
+                mode and top_k raise ValueError with chunk_size or max_large_item_len,
+                which mine with other engines
+            chunk_size: mine out-of-core in partitions of chunk_size actionsets (SON),
+                data_iter must then be a callable returning a fresh iterator
+            instrumentation: instrument.Instrument collecting phase timers and
+                counters of this run, dump it after run returns
+    """
+    with instrument.activate(instrumentation):
+        inst = instrument.get()
+        support_dict = {}
+        decode_vocab = None
+        if isinstance(data_iter, loader.Transactions) and not data_iter.encoded and vocab is None:
+            decode_vocab = vocab = data_iter.vocab
+            data_iter = data_iter.encode()
+        if engine is None:
+            engine = "fp_tree" if use_fp_tree else "apriori"
+        if max_large_item_len is not None and engine == "fp_tree":
+            engine = "apriori"
+        if (mode != "all" or top_k is not None) and (engine != "fp_tree" or chunk_size is not None):
+            raise ValueError("mode and top_k need the fp_tree engine without chunk_size or max_large_item_len")
+        if mode == "maximal" and not output_support_only:
+            raise ValueError("maximal itemsets carry no subset supports for rules, use output_support_only")
+        if chunk_size is not None:
+            with inst.phase("mining"):
+                support_dict = partition.compute_large_itemsets(partition.create_data_factory(data_iter),
+                    min_support, chunk_size, max_large_item_len=max_large_item_len)
+            if print_debug == True:
+                print('len(support_dict):', len(support_dict))
+        elif engine == "apriori":
+            with inst.phase("load"):
+                seed_itemsets, actionsets = generate_seed_itemsets_and_actionsets(data_iter)
+            inst.count("actionsets", len(actionsets))
+            support_dict = compute_large_itemsets(seed_itemsets, actionsets, min_support, max_large_item_len=max_large_item_len,
+                counting=counting)
+            if print_debug == True:
+                print('len(support_dict):', len(support_dict))
+        elif engine == "fp_tree":
+            root, header = fp.create_tree(data_iter, min_support)
+            support_dict = fp.compute_large_itemsets(root, header, min_support, workers=workers,
+                mode=mode, top_k=top_k)
+            if print_debug == True:
+                print('len(support_dict):', len(support_dict))
+        elif engine == "eclat":
+            with inst.phase("mining"):
+                vertical_db = eclat.create_vertical_db(data_iter, min_support)
+                support_dict = eclat.compute_large_itemsets(vertical_db, min_support,
+                    max_large_item_len=max_large_item_len, diffset=diffset)
+            if print_debug == True:
+                print('len(support_dict):', len(support_dict))
+        else:
+            raise ValueError("unknown engine: {}".format(engine))
 
-    for itemset, support in support_dict.items():
-        large_itemsets_with_support.append((support, tuple(itemset)))
+        large_itemsets_with_support = []
+        recommendation_rules_with_confidence = []
 
-    if output_support_only:
-        return large_itemsets_with_support, recommendation_rules_with_confidence
+        for itemset, support in support_dict.items():
+            if decode_vocab is not None:
+                itemset = decode_vocab.decode(itemset)
+            large_itemsets_with_support.append((support, tuple(itemset)))
+
+        inst.count("large_itemsets", len(support_dict))
+        if output_support_only:
+            return large_itemsets_with_support, recommendation_rules_with_confidence
 
-    recommendation_rules_with_confidence = compute_recom_rules(support_dict, min_confidence, to_file_only, print_debug)
-    return large_itemsets_with_support, recommendation_rules_with_confidence
+        recommendation_rules_with_confidence = compute_recom_rules(support_dict, min_confidence, to_file_only, print_debug,
+            vocab=vocab)
+        if decode_vocab is not None:
+            recommendation_rules_with_confidence = [(confidence, (decode_vocab.decode(base), decode_vocab.decode(recom)))
+                for confidence, (base, recom) in recommendation_rules_with_confidence]
+        return large_itemsets_with_support, recommendation_rules_with_confidence
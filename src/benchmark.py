@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+########################################################################
+#
+# Copyright (c) 2018 Wan Li. All Rights Reserved
+#
+########################################################################
+
+"""
+File: benchmark.py
+Author: Wan Li
+Date: 2018/06/21 14:30:52
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+import apriori as ap
+import freq_patt_tree as fp
+import fup
+import instrument
+import recomm
+import synthetic
+import util
+
+ENGINES = ["apriori", "fp_tree", "recommend"]
+DEFAULT_SIZES = [1000, 5000]
+DEFAULT_SUPPORTS = [0.05, 0.02]
+MIN_CONFIDENCE = 0.5
+
+def get_dataset_fn(workdir, n_transactions):
+    return os.path.join(workdir, "synthetic_{}.txt".format(n_transactions))
+
+def get_rules_fn(workdir, n_transactions, min_sup):
+    return os.path.join(workdir, "rules_{}_{}.csv".format(n_transactions, min_sup))
+
+def create_dataset(workdir, n_transactions, avg_len=10, n_items=1000, seed=0):
+    fn = get_dataset_fn(workdir, n_transactions)
+    if not os.path.isfile(fn):
+        synthetic.generate(fn, n_transactions, avg_len, n_items, seed=seed)
+    return fn
+
+def create_rules(workdir, n_transactions, min_sup):
+    """
+        Mine the rules recommend is benchmarked with, outside of the timed case
+    """
+    fn_rules = get_rules_fn(workdir, n_transactions, min_sup)
+    if os.path.isfile(fn_rules):
+        return fn_rules
+    data_iter = util.yield_actionsets_from_file(get_dataset_fn(workdir, n_transactions))
+    root, header = fp.create_tree(data_iter, min_sup)
+    support_dict = fp.compute_large_itemsets(root, header, min_sup)
+    fd = open(fn_rules, 'w')
+    for confidence, (base, recom) in ap.generate_recom_rules(support_dict, MIN_CONFIDENCE):
+        fd.write(str(confidence) + ',')
+        fd.write('|'.join(base) + ',')
+        fd.write('|'.join(recom))
+        fd.write('\n')
+    fd.close()
+    return fn_rules
+
+def run_case(case):
+    """
+        Time one case in this process
+
+        Params:
+            case: dict with engine, fn, min_sup and fn_rules for recommend
+        Return:
+            dict of wall_s, peak_rss_kb, output counts and phase instrumentation
+    """
+    engine = case["engine"]
+    result = {}
+    inst = instrument.Instrument()
+    time_s = time.time()
+    if engine == "apriori":
+        itemsets, _ = ap.run(util.yield_actionsets_from_file(case["fn"]), case["min_sup"],
+            MIN_CONFIDENCE, engine="apriori", output_support_only=True, instrumentation=inst)
+        result["n_itemsets"] = len(itemsets)
+    elif engine == "fp_tree":
+        itemsets, _ = ap.run(util.yield_actionsets_from_file(case["fn"]), case["min_sup"],
+            MIN_CONFIDENCE, engine="fp_tree", output_support_only=True, instrumentation=inst)
+        result["n_itemsets"] = len(itemsets)
+    elif engine == "recommend":
+        recomms = recomm.recommend(case["fn"], case["fn_rules"], return_results=True)
+        result["n_users"] = len(recomms)
+        result["n_recoms"] = sum(len(recoms) for _, recoms, _ in recomms)
+    else:
+        raise ValueError("unknown engine: {}".format(engine))
+    result["wall_s"] = time.time() - time_s
+    result["peak_rss_kb"] = instrument.get_peak_rss_kb()
+    result["instrument"] = inst.to_dict()
+    return result
+
+def run_case_in_subprocess(case, workdir, timeout=None):
+    """
+        Run case in a fresh interpreter so peak RSS is its own
+
+        The result is the last stdout line, miners may print progress before it.
+    """
+    env = dict(os.environ)
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    env["PYTHONPATH"] = src_dir + os.pathsep + env.get("PYTHONPATH", "")
+    cmd = [sys.executable, os.path.abspath(__file__), "--case", json.dumps(case)]
+    try:
+        proc = subprocess.run(cmd, cwd=workdir, env=env, timeout=timeout,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    except subprocess.TimeoutExpired:
+        return {"status": "timeout"}
+    lines = proc.stdout.strip().split('\n')
+    if proc.returncode != 0 or len(lines[-1]) == 0:
+        return {"status": "error", "error": proc.stderr.strip().split('\n')[-1]}
+    result = json.loads(lines[-1])
+    result["status"] = "ok"
+    return result
+
+def get_git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__)), universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmark(workdir, fn_out="benchmark.json", sizes=DEFAULT_SIZES, supports=DEFAULT_SUPPORTS,
+    engines=ENGINES, timeout=600, avg_len=10, n_items=1000, seed=0):
+    """
+        Time every engine over the grid of sizes and supports
+
+        Datasets and rules are generated once into workdir and reused by
+        later runs, so results of different versions are comparable.
+
+        Params:
+            supports: absolute counts, or floats below 1 as fraction of size
+            timeout: seconds per case, a slower case is recorded as timeout
+        Return:
+            benchmark report dict, also written to fn_out as json
+    """
+    if not os.path.isdir(workdir):
+        os.makedirs(workdir)
+    workdir = os.path.abspath(workdir)
+    results = []
+    for n_transactions in sizes:
+        fn = create_dataset(workdir, n_transactions, avg_len, n_items, seed)
+        for min_support in supports:
+            min_sup = fup.compute_threshold(min_support, n_transactions)
+            for engine in engines:
+                case = {"engine": engine, "fn": fn, "min_sup": min_sup}
+                if engine == "recommend":
+                    case["fn_rules"] = create_rules(workdir, n_transactions, min_sup)
+                result = run_case_in_subprocess(case, workdir, timeout)
+                result.update({"engine": engine, "n_transactions": n_transactions,
+                               "min_support": min_support, "min_sup": min_sup})
+                results.append(result)
+                print("{engine} n={n_transactions} min_sup={min_sup}: {status} {wall}".format(
+                    wall=result.get("wall_s"), **result))
+    report = {
+        "meta": {
+            "revision": get_git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "dataset": {"avg_len": avg_len, "n_items": n_items, "seed": seed},
+        },
+        "results": results,
+    }
+    fd = open(fn_out, 'w')
+    json.dump(report, fd, indent=2, sort_keys=True)
+    fd.close()
+    return report
+
+def compare(fn_old, fn_new, tolerance=0.2):
+    """
+        Cases slower than old by more than tolerance, or with changed counts
+
+        Yield:
+            (case key, old result, new result)
+    """
+    def load(fn):
+        fd = open(fn, 'r')
+        report = json.load(fd)
+        fd.close()
+        return dict(((r["engine"], r["n_transactions"], r["min_support"]), r) for r in report["results"])
+    old, new = load(fn_old), load(fn_new)
+    count_keys = ["n_itemsets", "n_users", "n_recoms"]
+    for key in sorted(set(old) & set(new), key=str):
+        r_old, r_new = old[key], new[key]
+        if r_old["status"] != "ok" or r_new["status"] != "ok":
+            if r_old["status"] != r_new["status"]:
+                yield key, r_old, r_new
+            continue
+        if r_new["wall_s"] > r_old["wall_s"] * (1 + tolerance) or \
+            any(r_old.get(k) != r_new.get(k) for k in count_keys):
+            yield key, r_old, r_new
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark miners on synthetic data")
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", default="bench")
+    parser.add_argument("--out", default="benchmark.json")
+    parser.add_argument("--sizes", type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument("--supports", type=float, nargs='+', default=DEFAULT_SUPPORTS)
+    parser.add_argument("--engines", nargs='+', default=ENGINES, choices=ENGINES)
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    args = parser.parse_args()
+    if args.case is not None:
+        print(json.dumps(run_case(json.loads(args.case))))
+    elif args.compare is not None:
+        for key, r_old, r_new in compare(*args.compare):
+            print("{}: {} -> {}".format(key, r_old, r_new))
+    else:
+        supports = [int(s) if s >= 1 else s for s in args.supports]
+        run_benchmark(args.workdir, args.out, args.sizes, supports, args.engines, args.timeout)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+########################################################################
+#
+# Copyright (c) 2018 Wan Li. All Rights Reserved
+#
+########################################################################
+
+"""
+File: bitmap.py
+Author: Wan Li
+Date: 2018/05/21 10:12:40
+"""
+
+from collections import defaultdict
+import numpy as np
+
+def popcount(bits):
+    """
+        Count set bits of a python int bitset
+    """
+    return bin(bits).count('1')
+
+if hasattr(int, 'bit_count'):
+    popcount = int.bit_count
+
+def create_tid_bitmaps(actionsets, items=None):
+    """
+        Build one transaction-id bitmap per item
+
+        Params:
+            actionsets: list of actionset, list index is the transaction id
+            items: optional set of items to keep, None keeps all
+        Return:
+            dict item -> python int, bit i set if transaction i holds item
+    """
+    tid_lists = defaultdict(list)
+    for tid, actionset in enumerate(actionsets):
+        for item in actionset:
+            if items is None or item in items:
+                tid_lists[item].append(tid)
+    nbytes = (len(actionsets) + 7) // 8
+    tid_bitmaps = {}
+    for item, tids in tid_lists.items():
+        buf = bytearray(nbytes)
+        for tid in tids:
+            buf[tid >> 3] |= 1 << (tid & 7)
+        tid_bitmaps[item] = int.from_bytes(bytes(buf), 'little')
+    return tid_bitmaps
+
+def create_tid_bitmaps_from_csr(indptr, indices, names, items=None):
+    """
+        Build one transaction-id bitmap per item of CSR actionsets, as loader.Transactions
+
+        Params:
+            indptr, indices: numpy arrays, row i holds ids indices[indptr[i]:indptr[i + 1]]
+            names: id -> item, keys of the returned dict
+            items: optional set of items to keep, None keeps all
+        Return:
+            dict item -> python int, bit i set if transaction i holds item
+    """
+    n_rows = len(indptr) - 1
+    tids = np.repeat(np.arange(n_rows, dtype=np.int64), np.diff(indptr))
+    order = np.argsort(indices, kind='stable')
+    sorted_ids = indices[order]
+    tids = tids[order]
+    bounds = np.searchsorted(sorted_ids, np.arange(len(names) + 1))
+    nbytes = (n_rows + 7) // 8
+    tid_bitmaps = {}
+    for item_id in range(len(names)):
+        start, end = bounds[item_id], bounds[item_id + 1]
+        if start == end or (items is not None and names[item_id] not in items):
+            continue
+        item_tids = tids[start:end]
+        buf = np.zeros(nbytes, dtype=np.uint8)
+        np.bitwise_or.at(buf, item_tids >> 3, (1 << (item_tids & 7)).astype(np.uint8))
+        tid_bitmaps[names[item_id]] = int.from_bytes(buf.tobytes(), 'little')
+    return tid_bitmaps
+
+def intersect(itemset, tid_bitmaps):
+    """
+        AND together the bitmaps of every item in itemset
+    """
+    bits = None
+    for item in itemset:
+        item_bits = tid_bitmaps.get(item, 0)
+        bits = item_bits if bits is None else bits & item_bits
+        if bits == 0:
+            break
+    return bits if bits is not None else 0
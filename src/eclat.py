@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+########################################################################
+#
+# Copyright (c) 2018 Wan Li. All Rights Reserved
+#
+########################################################################
+
+"""
+File: eclat.py
+Author: Wan Li
+Date: 2018/05/22 14:03:18
+"""
+
+from collections import defaultdict
+import bitmap
+import loader
+
+def create_vertical_db(data_iter, min_sup=2):
+    """
+        Build vertical database of frequent items
+
+        Params:
+            data_iter: iterable of actionsets, loader.Transactions skips per row sets
+        Return:
+            list of tuple (item, tid bitmap, support), sorted by ascending support
+    """
+    if isinstance(data_iter, loader.Transactions):
+        tid_bitmaps = bitmap.create_tid_bitmaps_from_csr(data_iter.indptr, data_iter.indices,
+            data_iter.item_keys())
+    else:
+        actionsets = [frozenset(actionset) for actionset in data_iter]
+        tid_bitmaps = bitmap.create_tid_bitmaps(actionsets)
+    vertical_db = []
+    for item, bits in tid_bitmaps.items():
+        sup = bitmap.popcount(bits)
+        if sup >= min_sup:
+            vertical_db.append((item, bits, sup))
+    vertical_db.sort(key=lambda x: (x[2], x[0]))
+    return vertical_db
+
+def mine(prefix, klass, min_sup, large_itemset_dict, max_large_item_len=None, diffset=False):
+    """
+        Depth-first mining of one equivalence class
+
+        Params:
+            prefix: tuple of items shared by the class
+            klass: list of tuple (item, tidset or diffset, support)
+            diffset: whether klass holds diffsets instead of tidsets
+    """
+    for i, (item, bits, sup) in enumerate(klass):
+        itemset = prefix + (item,)
+        large_itemset_dict[frozenset(itemset)] = sup
+        if max_large_item_len is not None and len(itemset) >= max_large_item_len:
+            continue
+        sub_klass = []
+        for other, other_bits, _ in klass[i + 1:]:
+            if diffset:
+                # d(PXY) = d(PY) - d(PX)
+                sub_bits = other_bits & ~bits
+                sub_sup = sup - bitmap.popcount(sub_bits)
+            else:
+                sub_bits = bits & other_bits
+                sub_sup = bitmap.popcount(sub_bits)
+            if sub_sup >= min_sup:
+                sub_klass.append((other, sub_bits, sub_sup))
+        if len(sub_klass) > 0:
+            mine(itemset, sub_klass, min_sup, large_itemset_dict,
+                max_large_item_len=max_large_item_len, diffset=diffset)
+
+def compute_large_itemsets(vertical_db, min_sup=2, max_large_item_len=None, diffset=False):
+    """
+        Eclat, or dEclat when diffset is set
+
+        Return:
+            dict itemset -> support
+    """
+    large_itemset_dict = defaultdict(int) # key: itemset val: support
+    for i, (item, bits, sup) in enumerate(vertical_db):
+        large_itemset_dict[frozenset([item])] = sup
+        if max_large_item_len is not None and max_large_item_len <= 1:
+            continue
+        klass = []
+        for other, other_bits, _ in vertical_db[i + 1:]:
+            joint_bits = bits & other_bits
+            joint_sup = bitmap.popcount(joint_bits)
+            if joint_sup < min_sup:
+                continue
+            if diffset:
+                # d(XY) = t(X) - t(Y)
+                klass.append((other, bits & ~other_bits, joint_sup))
+            else:
+                klass.append((other, joint_bits, joint_sup))
+        mine((item,), klass, min_sup, large_itemset_dict,
+            max_large_item_len=max_large_item_len, diffset=diffset)
+    return large_itemset_dict
@@ -12,148 +12,643 @@ Author: Wan Li
 Date: 2018/04/12 16:15:48
 """
 
+import heapq
+import multiprocessing
+from array import array
 from collections import defaultdict
+import numpy as np
+import instrument
+import loader
 
 ROOT_NODE_NAME = "ROOT"
+NIL = -1
+SHORT_PATH_LEN = 16 # prefix paths up to this long are walked, longer ones cached
 
-class Node:
-    def __init__(self, name, count, parent):
-        self.name = name
-        self.count = count
-        self.next = None # header chain
-        self.parent = parent
-        self.children = {}
+class FPTree:
+    """
+        Array backed FP-tree
 
-    def increment(self, count):
-        self.count += count
+        Node i lives in parallel arrays parent[i], item[i], count[i], next[i],
+        node 0 is the root. Items are encoded as ids ranked by descending support,
+        so an ordered transaction is just its sorted item ids.
+    """
+    def __init__(self, names, item_counts, min_sup=None):
+        self.names = names # item id -> name
+        self.item_counts = item_counts # item id -> support
+        self.min_sup = min_sup # threshold items were pruned at, mining needs at least this
+        self.parent = array('i', [NIL])
+        self.item = array('i', [NIL])
+        self.count = array('l', [1])
+        self.next = array('i', [NIL]) # header chain
+        self.header = array('i', [NIL]) * len(names) # item id -> first node
+        self.tail = array('i', [NIL]) * len(names) # item id -> last node
+        self.children = {} # parent * len(names) + item id -> node, only while building
+        self.path_cache = None # PathCache of root paths, filled while mining
 
-    def dump(self, indent=1, func=None, fd=None):
+    def __len__(self):
+        return len(self.parent)
+
+    def child_index(self):
+        """
+            Child lookup table, rebuilt from parent/item arrays after compact()
+        """
+        if self.children is None:
+            width = len(self.names)
+            self.children = {}
+            for node in range(1, len(self.parent)):
+                self.children[self.parent[node] * width + self.item[node]] = node
+        return self.children
+
+    def compact(self):
+        """
+            Drop the child lookup table once the tree is built
+        """
+        self.children = None
+
+    def insert(self, item_ids, count):
+        """
+            Insert sorted item ids with count
+        """
+        children = self.child_index()
+        width = len(self.names)
+        node = 0
+        for item_id in item_ids:
+            key = node * width + item_id
+            child = children.get(key)
+            if child is None:
+                child = len(self.parent)
+                self.parent.append(node)
+                self.item.append(item_id)
+                self.count.append(count)
+                self.next.append(NIL)
+                children[key] = child
+                # update header in O(1) through the tail pointer
+                if self.header[item_id] == NIL:
+                    self.header[item_id] = child
+                else:
+                    self.next[self.tail[item_id]] = child
+                self.tail[item_id] = child
+            else:
+                self.count[child] += count
+            node = child
+
+    def prefix_path(self, node):
+        """
+            Item ids from root (exclusive) down to node (exclusive)
+
+            Short paths are walked. A longer walk stops at the first node
+            already walked, so deep nodes are walked once per mining pass and
+            later paths through them come from the PathCache.
+        """
+        parents, items = self.parent, self.item
+        parent = node = parents[node]
+        path = []
+        for _ in range(SHORT_PATH_LEN):
+            if node <= 0:
+                path.reverse()
+                return tuple(path)
+            path.append(items[node])
+            node = parents[node]
+        if self.path_cache is None:
+            self.path_cache = PathCache(len(self.parent))
+        cache = self.path_cache
+        path = cache.paths.get(parent)
+        if path is not None:
+            return path
+        segment_ids = cache.segment_ids
+        if segment_ids[parent] == NIL:
+            walked = []
+            node = parent
+            while node > 0 and segment_ids[node] == NIL:
+                walked.append(node)
+                node = self.parent[node]
+            walked.reverse()
+            cache.add(walked, [self.item[i] for i in walked], node)
+        return cache.path(parent)
+
+    def clear_path_cache(self):
+        self.path_cache = None
+
+    def is_single_path(self):
+        """
+            Whether every node is the only child of the previous one
+        """
+        parent = self.parent
+        for node in range(1, len(parent)):
+            if parent[node] != node - 1:
+                return False
+        return True
+
+    def dump(self, indent=1, func=None, fd=None, print_tree=False):
         """
-            Print tree
+            Write tree
             Params:
                 func: optional function (name) -> string
                 fd: file descriptor
+                print_tree: also print every node
         """
-        if fd is None:
+        own_fd = fd is None
+        if own_fd:
             fd = open('out_fptree.txt', 'w')
-        content = '-'*indent + self.name + ':' + str(self.count)
-        print(content)
-        if func is not None:
-            content += ' info:' + func(self.name)
-        fd.write(content)
-        fd.write('\n')
-        for ch in self.children.values():
-            ch.dump(indent=indent+1, func=func, fd=fd)
-        if indent == 1:
+        child_lists = defaultdict(list)
+        for node in range(1, len(self.parent)):
+            child_lists[self.parent[node]].append(node)
+        stack = [(0, indent)]
+        while len(stack) > 0:
+            node, depth = stack.pop()
+            name = ROOT_NODE_NAME if node == 0 else self.names[self.item[node]]
+            content = '-'*depth + str(name) + ':' + str(self.count[node])
+            if print_tree:
+                print(content)
+            if func is not None:
+                content += ' info:' + func(name)
+            fd.write(content)
+            fd.write('\n')
+            for ch in reversed(child_lists[node]):
+                stack.append((ch, depth + 1))
+        if own_fd:
             fd.close()
 
-def load_file(fname):
-    fd = open(fname, 'r')
-    for line in fd:
-        line = line.strip().rstrip(',')
-        actionset = frozenset(line.split(','))
-        yield actionset
-
-def update_header(cur_node, new_node):
-    while (cur_node.next is not None):
-        cur_node = cur_node.next
-    cur_node.next = new_node
-
-def update_tree(current_node, header, ordered_actions, actionset_count, largeitem_count_dict):
-    if len(ordered_actions) == 0:
-        pass
-    item = ordered_actions[0][0]
-    # update children
-    if item in current_node.children:
-        current_node.children[item].increment(actionset_count)
+class PathCache:
+    """
+        Root paths of FPTree nodes met while mining
+
+        A walk up the tree is kept as one segment of item ids, node i ending
+        the first lengths[i] items of segment segment_ids[i]. A node where a
+        later walk stops is shared by several subtrees and keeps its whole
+        path, every segment continues such a node or the root. A long branch
+        so costs its length and not its length squared.
+    """
+    def __init__(self, n_nodes):
+        self.paths = {} # shared node -> item ids from root down to it
+        self.segment_ids = array('i', [NIL]) * n_nodes
+        self.lengths = array('i', [0]) * n_nodes
+        self.segments = [] # segment id -> tuple of item ids
+        self.bases = [] # segment id -> shared node it continues, 0 for root
+
+    def add(self, nodes, items, base):
+        """
+            Cache nodes walked down from base, holding items
+        """
+        if base > 0 and base not in self.paths:
+            self.paths[base] = self.path(base)
+        segment_id = len(self.segments)
+        self.segments.append(tuple(items))
+        self.bases.append(base)
+        for length, node in enumerate(nodes, 1):
+            self.segment_ids[node] = segment_id
+            self.lengths[node] = length
+
+    def path(self, node):
+        """
+            Item ids from root (exclusive) down to node (inclusive)
+        """
+        path = self.paths.get(node)
+        if path is not None:
+            return path
+        segment_id = self.segment_ids[node]
+        segment = self.segments[segment_id]
+        length = self.lengths[node]
+        if length < len(segment):
+            segment = segment[:length]
+        base = self.bases[segment_id]
+        return self.paths[base] + segment if base > 0 else segment
+
+def to_numpy(values, typecode):
+    return np.frombuffer(values, dtype=np.dtype(typecode)) if len(values) > 0 \
+        else np.zeros(0, dtype=np.dtype(typecode))
+
+def from_numpy(values, typecode):
+    arr = array(typecode)
+    arr.frombytes(np.ascontiguousarray(values, dtype=np.dtype(typecode)).tobytes())
+    return arr
+
+def save_tree(tree, fn):
+    """
+        Snapshot tree to fn as npz, node arrays are stored as they are
+
+        Build once at the lowest min_sup of interest, load_tree then mines
+        any higher one without reading the data again. Names must be all ints,
+        as from an item_vocab, or all strings. fn is written as given, without
+        the .npz suffix np.savez would add to a path.
+    """
+    if tree is None:
+        raise ValueError("no tree to save, nothing was frequent")
+    if all(isinstance(name, int) for name in tree.names):
+        names = np.array(tree.names, dtype=np.int64)
     else:
-        current_node.children[item] = Node(item, actionset_count, current_node)
-        # update header
-        if item not in header:
-            header[item] = current_node.children[item]
-        else:
-            update_header(header[item], current_node.children[item])
-    if len(ordered_actions) > 1:
-        update_tree(current_node.children[item], header,
-            ordered_actions[1::], actionset_count, largeitem_count_dict)
-
-def build_fp_tree(actionset_count_dict, min_sup=2):
-    header = {} # key: name val: node
-    item_count_dict = defaultdict(int)
-    largeitem_count_dict = defaultdict(int)
-    largeitemset = set()
-    # count
-    for actionset, actionset_count in actionset_count_dict.items():
-        for item in actionset:
-            item_count_dict[item] += actionset_count
+        names = loader.join_names(tree.names)
+    with open(fn, 'wb') as fd:
+        np.savez(fd, names=names, names_are_ints=np.array([names.dtype == np.int64]),
+            item_counts=np.array(tree.item_counts, dtype=np.int64),
+            min_sup=np.array([tree.min_sup if tree.min_sup is not None else 0], dtype=np.int64),
+            parent=to_numpy(tree.parent, 'i'), item=to_numpy(tree.item, 'i'),
+            count=to_numpy(tree.count, 'l').astype(np.int64), next=to_numpy(tree.next, 'i'),
+            header=to_numpy(tree.header, 'i'), tail=to_numpy(tree.tail, 'i'))
+
+def load_tree(fn):
+    """
+        Load a snapshot of save_tree
+
+        Return:
+            tree, tree.header as create_tree, ready for compute_large_itemsets at
+            any min_sup no lower than the one it was built with
+    """
+    data = np.load(fn)
+    names = data["names"].tolist() if data["names_are_ints"][0] else loader.split_names(data["names"])
+    min_sup = int(data["min_sup"][0])
+    tree = FPTree(names, data["item_counts"].tolist(), min_sup if min_sup > 0 else None)
+    tree.parent = from_numpy(data["parent"], 'i')
+    tree.item = from_numpy(data["item"], 'i')
+    tree.count = from_numpy(data["count"], 'l')
+    tree.next = from_numpy(data["next"], 'i')
+    tree.header = from_numpy(data["header"], 'i')
+    tree.tail = from_numpy(data["tail"], 'i')
+    tree.compact()
+    data.close()
+    return tree, tree.header
+
+def load_file(fname, vocab=None):
+    with open(fname, 'r') as fd:
+        for line in fd:
+            line = line.strip().rstrip(',')
+            actionset = frozenset(line.split(','))
+            if vocab is not None:
+                actionset = vocab.encode(actionset)
+            yield actionset
+
+def build_fp_tree(actionset_count_dict, min_sup=2, item_count_dict=None):
+    """
+        Params:
+            item_count_dict: support of every item to keep, counted from
+                actionset_count_dict if None, other items are dropped
+    """
+    if item_count_dict is None:
+        item_count_dict = defaultdict(int)
+        # count
+        for actionset, actionset_count in actionset_count_dict.items():
+            for item in actionset:
+                item_count_dict[item] += actionset_count
     # prune
-    for k, v in item_count_dict.items():
-        if v >= min_sup:
-            largeitem_count_dict[k] = v
-            largeitemset.add(k)
-    if len(largeitemset) == 0:
+    largeitems = [(k, v) for k, v in item_count_dict.items() if v >= min_sup]
+    if len(largeitems) == 0:
         return None, None
+    # rank items by descending support
+    largeitems.sort(key=lambda x: (x[1], x[0]), reverse=True)
+    names = [k for k, v in largeitems]
+    item_ids = dict((k, i) for i, k in enumerate(names))
     # init tree
-    root = Node(ROOT_NODE_NAME, 1, None)
+    tree = FPTree(names, [v for k, v in largeitems], min_sup)
     # build tree
     for actionset, actionset_count in actionset_count_dict.items():
-        # sort current actionset
-        actions = []
-        for action in actionset:
-            if action in largeitem_count_dict:
-                actions.append(action)
-        if len(actions) == 0:
+        ordered_ids = sorted([item_ids[action] for action in actionset if action in item_ids])
+        if len(ordered_ids) == 0:
             continue
-        ordered_actions = sorted([(action, largeitem_count_dict[action]) for action in actions],
-            key=lambda x: (x[1], x[0]), reverse=True)
-        update_tree(root, header, ordered_actions, actionset_count, largeitem_count_dict)
-    return root, header
-    
+        tree.insert(ordered_ids, actionset_count)
+    tree.compact()
+    return tree, tree.header
+
 def create_tree(data_iter, min_sup=2):
+    inst = instrument.get()
     actionset_count_dict = defaultdict(int)
     # count
-    for actionset in data_iter:
-        actionset_count_dict[actionset] += 1
-    return build_fp_tree(actionset_count_dict, min_sup)
+    with inst.phase("load"):
+        for actionset in data_iter:
+            actionset_count_dict[actionset] += 1
+    with inst.phase("tree_build"):
+        tree, header = build_fp_tree(actionset_count_dict, min_sup)
+    if tree is not None:
+        inst.count("tree_nodes", len(tree))
+    return tree, header
 
-def ascend(node, prefixes):
-      if node.parent is not None:
-          prefixes.append(node.name)
-          ascend(node.parent, prefixes)
+def conditional_pattern_base(tree, item_id, encoded=False):
+    """
+        Prefix paths of every node in item's header chain
 
-def conditional_pattern_base(header_node):
+        Params:
+            encoded: keep paths as tree item ids instead of names
+        Return:
+            dict tuple of names -> count, total count of item
+    """
     conditional_paths = {}
     header_node_count = 0
-    node = header_node
-    while node is not None:
-        prefixes = []
-        ascend(node, prefixes)
-        if len(prefixes) > 1:
-            conditional_paths[frozenset(prefixes[1:])] = node.count
-        header_node_count += node.count
-        node = node.next
+    node = tree.header[item_id]
+    while node != NIL:
+        prefixes = tree.prefix_path(node)
+        if len(prefixes) > 0:
+            if not encoded:
+                prefixes = tuple([tree.names[i] for i in prefixes])
+            conditional_paths[prefixes] = tree.count[node]
+        header_node_count += tree.count[node]
+        node = tree.next[node]
     return conditional_paths, header_node_count
 
-def compute_large_itemsets(root, header, min_sup=2):
+class SupersetIndex:
+    """
+        Inverted index answering whether an added itemset contains a query itemset
+    """
+    def __init__(self):
+        self.postings = defaultdict(set) # item -> ids of itemsets holding it
+        self.sizes = [] # id -> itemset size
+
+    def add(self, itemset):
+        itemset_id = len(self.sizes)
+        self.sizes.append(len(itemset))
+        for item in itemset:
+            self.postings[item].add(itemset_id)
+
+    def has_superset(self, itemset, strict=False):
+        postings = []
+        for item in itemset:
+            posting = self.postings.get(item)
+            if not posting:
+                return False
+            postings.append(posting)
+        if len(postings) == 0:
+            ids = range(len(self.sizes))
+        else:
+            postings.sort(key=len)
+            ids = postings[0].intersection(*postings[1:])
+        if strict:
+            return any(self.sizes[i] > len(itemset) for i in ids)
+        return len(ids) > 0
+
+class ClosedSupportDict(dict):
+    """
+        Closed itemset -> support
+
+        Looking up any other frequent itemset returns the largest support of
+        its closed supersets, which is its own support, so rule generation
+        can run on closed itemsets only.
+    """
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        self.postings = None
+        self.cache = {}
+
+    def __missing__(self, itemset):
+        if itemset in self.cache:
+            return self.cache[itemset]
+        if self.postings is None:
+            self.postings = defaultdict(list)
+            for closed_itemset in dict.keys(self):
+                for item in closed_itemset:
+                    self.postings[item].append(closed_itemset)
+        support = 0
+        if len(itemset) > 0:
+            item = min(itemset, key=lambda x: len(self.postings.get(x, ())))
+            for closed_itemset in self.postings.get(item, ()):
+                if itemset.issubset(closed_itemset):
+                    support = max(support, dict.__getitem__(self, closed_itemset))
+        self.cache[itemset] = support
+        return support
+
+class MiningState:
+    """
+        Options and running state of one FP-growth pass
+
+        mode "closed" and "maximal" merge items found in every conditional path
+        into the suffix, as no closed itemset holds the suffix without them.
+        "maximal" only keeps itemsets whose conditional tree is empty or a single
+        path taken whole, any other has a frequent superset, and skips a branch
+        when the suffix plus every item left in its conditional base is covered
+        by one kept so far. top_k
+        raises the threshold to the k-th best support found so far.
+    """
+    def __init__(self, min_sup, mode="all", top_k=None):
+        if mode not in ("all", "closed", "maximal"):
+            raise ValueError("unknown mode: {}".format(mode))
+        if top_k is not None and mode != "all":
+            raise ValueError("top_k only applies to mode all")
+        self.min_sup = min_sup
+        self.mode = mode
+        self.top_k = top_k
+        self.heap = [] # k best supports
+        self.found = SupersetIndex() if mode == "maximal" else None # maximal candidates
+
+    def threshold(self):
+        if self.top_k is None or len(self.heap) < self.top_k:
+            return self.min_sup
+        return max(self.min_sup, self.heap[0])
+
+    def emit(self, itemset, count, large_itemset_dict):
+        large_itemset_dict[frozenset(itemset)] = count
+        if self.top_k is not None:
+            if len(self.heap) < self.top_k:
+                heapq.heappush(self.heap, count)
+            elif count > self.heap[0]:
+                heapq.heapreplace(self.heap, count)
+        if self.found is not None:
+            self.found.add(itemset)
+
+def mine_item(itemset, conditional_paths, header_node_count, state, large_itemset_dict):
+    """
+        Emit itemset and build the conditional tree of its pattern base
+
+        Return:
+            (conditional tree, itemset it extends) or None if nothing to mine
+    """
+    if header_node_count < state.threshold():
+        return None
+    item_count_dict = None
+    if state.mode != "all":
+        item_count_dict = defaultdict(int)
+        for path, count in conditional_paths.items():
+            for item in path:
+                item_count_dict[item] += count
+        merged = [item for item, count in item_count_dict.items() if count == header_node_count]
+        if len(merged) > 0:
+            # merged items are left out of the conditional tree
+            itemset = itemset + tuple(merged)
+            for item in merged:
+                del item_count_dict[item]
+        if state.found is not None:
+            tail = [item for item, count in item_count_dict.items() if count >= state.threshold()]
+            if state.found.has_superset(set(itemset).union(tail)):
+                return None
+    if state.found is None:
+        state.emit(itemset, header_node_count, large_itemset_dict)
+    sub_tree, sub_header = build_fp_tree(conditional_paths, state.threshold(), item_count_dict)
+    if sub_tree is None:
+        if state.found is not None:
+            state.emit(itemset, header_node_count, large_itemset_dict)
+        return None
+    if state.found is not None and sub_tree.is_single_path():
+        # the whole path is the only maximal candidate left in the branch
+        state.emit(itemset + tuple(sub_tree.names), sub_tree.item_counts[-1], large_itemset_dict)
+        return None
+    inst = instrument.get()
+    if inst.enabled:
+        inst.count("conditional_trees")
+        inst.count("conditional_tree_nodes", len(sub_tree))
+        inst.maximum("conditional_tree_depth", len(itemset))
+    return sub_tree, itemset
+
+def create_mining_frame(tree, suffix, state):
+    """
+        Stack frame [tree, path items, suffix, next item id] of mine
+
+        In mode "all" a single path tree is kept as its (name, count) items
+        only, every combination of them is frequent with the count of its
+        deepest item.
+    """
+    if state.mode == "all" and tree.is_single_path():
+        instrument.get().count("single_path_trees")
+        path_items = [(tree.names[i], tree.item_counts[i]) for i in range(len(tree.names))]
+        return [None, path_items, suffix, len(path_items) - 1]
+    return [tree, None, suffix, len(tree.header) - 1]
+
+def mine(tree, suffix, state, large_itemset_dict):
+    """
+        FP-growth over every header item of tree, least frequent first
+
+        Conditional trees are mined depth first from an explicit stack, so
+        long itemsets do not hit the recursion limit. Combinations of a single
+        path are emitted in the order conditional trees would produce them.
+    """
+    stack = [create_mining_frame(tree, suffix, state)]
+    while len(stack) > 0:
+        frame = stack[-1]
+        tree, path_items, suffix, item_id = frame
+        if item_id < 0:
+            stack.pop()
+            if tree is not None:
+                tree.clear_path_cache()
+            continue
+        frame[3] = item_id - 1
+        if tree is None:
+            name, count = path_items[item_id]
+            if count < state.threshold():
+                continue
+            itemset = suffix + (name,)
+            state.emit(itemset, count, large_itemset_dict)
+            if item_id > 0 and count >= state.threshold():
+                # the conditional tree of a path item is the path above it with
+                # the item's count everywhere, so ranked by name alone
+                sub_items = sorted([(above, count) for above, _ in path_items[:item_id]], reverse=True)
+                stack.append([None, sub_items, itemset, item_id - 1])
+            continue
+        if tree.item_counts[item_id] < state.threshold():
+            continue
+        conditional_paths, header_node_count = conditional_pattern_base(tree, item_id)
+        conditional = mine_item(suffix + (tree.names[item_id],), conditional_paths, header_node_count,
+            state, large_itemset_dict)
+        if conditional is not None:
+            stack.append(create_mining_frame(conditional[0], conditional[1], state))
+
+def mine_conditional_task(task, state=None):
+    """
+        Pool task: mine one header item from its id encoded conditional pattern base
+
+        Params:
+            state: MiningState shared across tasks, None creates one per task
+    """
+    item_id, conditional_paths, header_node_count, min_sup, mode, top_k = task
+    if state is None:
+        state = MiningState(min_sup, mode, top_k)
+    large_itemset_dict = {}
+    conditional = mine_item((item_id,), conditional_paths, header_node_count, state, large_itemset_dict)
+    if conditional is not None:
+        mine(conditional[0], conditional[1], state, large_itemset_dict)
+    return list(large_itemset_dict.items())
+
+def yield_conditional_tasks(tree, state):
+    for item_id in range(len(tree.header) - 1, -1, -1):
+        if tree.item_counts[item_id] < state.threshold():
+            continue
+        conditional_paths, header_node_count = conditional_pattern_base(tree, item_id, encoded=True)
+        yield item_id, conditional_paths, header_node_count, state.min_sup, state.mode, state.top_k
+
+def filter_top_k(large_itemset_dict, top_k):
+    """
+        Keep itemsets with support no less than the k-th best, ties included
+    """
+    if len(large_itemset_dict) <= top_k:
+        return large_itemset_dict
+    kth = heapq.nlargest(top_k, large_itemset_dict.values())[-1]
+    filtered = defaultdict(int)
+    for k, v in large_itemset_dict.items():
+        if v >= kth:
+            filtered[k] = v
+    return filtered
+
+def filter_closed(large_itemset_dict):
+    """
+        Keep itemsets without a proper superset of equal support
+    """
+    support_groups = defaultdict(list)
+    for k, v in large_itemset_dict.items():
+        support_groups[v].append(k)
+    indexes = {}
+    for v, itemsets in support_groups.items():
+        indexes[v] = SupersetIndex()
+        for k in itemsets:
+            indexes[v].add(k)
+    closed = ClosedSupportDict()
+    for k, v in large_itemset_dict.items():
+        if not indexes[v].has_superset(k, strict=True):
+            closed[k] = v
+    return closed
+
+def filter_maximal(large_itemset_dict):
+    """
+        Keep itemsets without any proper superset
+    """
+    index = SupersetIndex()
+    for k in large_itemset_dict.keys():
+        index.add(k)
+    maximal = defaultdict(int)
+    for k, v in large_itemset_dict.items():
+        if not index.has_superset(k, strict=True):
+            maximal[k] = v
+    return maximal
+
+def compute_large_itemsets(root, header, min_sup=2, workers=None, chunksize=16, mode="all", top_k=None):
+    """
+        FP-growth, header items are mined from their id encoded conditional
+        pattern bases and merged in header order
+
+        Params:
+            workers: number of processes, None or 1 mines in process
+            chunksize: header items per pool task
+            mode: "all", "closed" or "maximal" large itemsets, a closed result is
+                a ClosedSupportDict accepted by rule generation
+            top_k: mode "all" only, keep the k most supported itemsets (ties included)
+
+        root may be built, or loaded by load_tree, at any min_sup up to this
+        one, header items below min_sup are skipped.
+        With workers, conditional tree counters of the instrument stay in the workers.
+    """
     if root is None:
         return {}
-    large_itemset_dict = defaultdict(int) # key: itemset val: support
-    for name, node in header.items():
-        conditional_paths, header_node_count = conditional_pattern_base(node)
-        sub_root, sub_header = build_fp_tree(conditional_paths, min_sup)
-        items_dict = compute_large_itemsets(sub_root, sub_header, min_sup)
-        update_dict = defaultdict(int)
-
-        # append current node.name to every key, retain count
-        for k, v in items_dict.items():
-            new_k = set(k)
-            new_k.add(node.name)
-            update_dict[frozenset(new_k)] += v
-
-        # create single set with current count
-        update_dict[frozenset([node.name])] += header_node_count
-        
-        # update final dict
-        for k, v in update_dict.items():
-            large_itemset_dict[k] += v
-    return large_itemset_dict
\ No newline at end of file
+    if root.min_sup is not None and min_sup < root.min_sup:
+        raise ValueError("tree was built at min_sup {}, cannot mine at {}".format(root.min_sup, min_sup))
+    with instrument.get().phase("conditional_mining"):
+        state = MiningState(min_sup, mode, top_k)
+        large_itemset_dict = defaultdict(int) # key: itemset val: support
+        names = root.names
+        tasks = yield_conditional_tasks(root, state)
+        pool = None
+        if workers is not None and workers > 1:
+            pool = multiprocessing.Pool(workers)
+            results = pool.imap(mine_conditional_task, tasks, chunksize)
+        else:
+            results = (mine_conditional_task(task, state) for task in tasks)
+        try:
+            for items in results:
+                for k, v in items:
+                    large_itemset_dict[frozenset([names[i] for i in k])] += v
+        finally:
+            root.clear_path_cache()
+            if pool is not None:
+                pool.close()
+                pool.join()
+        if top_k is not None:
+            large_itemset_dict = filter_top_k(large_itemset_dict, top_k)
+        if mode == "closed":
+            return filter_closed(large_itemset_dict)
+        if mode == "maximal" and pool is not None:
+            # tasks are pruned alone, in process every candidate was checked
+            # against all found before it
+            return filter_maximal(large_itemset_dict)
+        return large_itemset_dict
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+########################################################################
+#
+# Copyright (c) 2018 Wan Li. All Rights Reserved
+#
+########################################################################
+
+"""
+File: fup.py
+Author: Wan Li
+Date: 2018/06/12 09:48:25
+"""
+
+import math
+from collections import deque
+from itertools import chain
+import apriori as ap
+import partition
+
+def compute_threshold(min_support, n_transactions):
+    """
+        Absolute support threshold
+
+        Params:
+            min_support: absolute count, or a float below 1 as fraction of n_transactions
+    """
+    if isinstance(min_support, float) and min_support < 1:
+        return max(1, int(math.ceil(min_support * n_transactions)))
+    return min_support
+
+def count_itemsets(candidates, data_iter, chunk_size=10000):
+    """
+        Exact support of candidates over data_iter, missing means 0
+    """
+    count_dict = {}
+    if len(candidates) == 0:
+        return count_dict
+    for chunk in partition.yield_chunks(data_iter, chunk_size):
+        for itemset, count in partition.count_candidates(chunk, candidates).items():
+            count_dict[itemset] = count_dict.get(itemset, 0) + count
+    return count_dict
+
+def update_large_itemsets(support_dict, n_transactions, added, min_support, removed=None,
+    retained_data=None, max_large_item_len=None):
+    """
+        FUP/FUP2 maintenance of large itemsets
+
+        Itemsets large in the old data get their counts shifted by the added
+        and removed batches. An itemset small in the old data had at most
+        old threshold - 1 occurrences, so it can only become large if its
+        count in added minus removed makes up the gap; only those few are
+        counted over the retained old data.
+
+        Params:
+            support_dict: large itemsets of the old data, as from apriori.load_support_dict
+            n_transactions: actionsets in the old data
+            added: iterable of new actionsets
+            min_support: absolute count, or a float below 1 as fraction of all actionsets
+            removed: iterable of expired actionsets of the old data
+            retained_data: callable returning an iterator over the old data
+                without removed, only read when some itemset may be promoted
+        Return:
+            dict itemset -> support, new actionset count
+    """
+    added = [frozenset(actionset) for actionset in added]
+    removed = [frozenset(actionset) for actionset in removed] if removed is not None else []
+    n_new = n_transactions + len(added) - len(removed)
+    thr_old = compute_threshold(min_support, n_transactions) if n_transactions > 0 else 1
+    thr_new = compute_threshold(min_support, n_new)
+    # least count gain (added - removed) for an old small itemset to become large
+    min_gain = thr_new - thr_old + 1
+
+    def count_retained(candidates):
+        if len(candidates) == 0 or n_transactions == 0:
+            return {}
+        if retained_data is None:
+            raise ValueError("retained_data is needed to check promoted itemsets")
+        return count_itemsets(candidates, retained_data())
+
+    new_support_dict = {}
+    candidates = set([itemset for itemset in support_dict if len(itemset) == 1])
+    for actionset in added:
+        for item in actionset:
+            candidates.add(frozenset([item]))
+    if min_gain <= 0:
+        # threshold dropped: items absent from added may be promoted as well
+        for actionset in (retained_data() if retained_data is not None and n_transactions > 0 else []):
+            for item in actionset:
+                candidates.add(frozenset([item]))
+    itemset_size = 1
+    while len(candidates) > 0:
+        added_counts = count_itemsets(candidates, added)
+        removed_counts = count_itemsets(candidates, removed)
+        large_itemsets = set()
+        rescan = set()
+        for itemset in candidates:
+            gain = added_counts.get(itemset, 0) - removed_counts.get(itemset, 0)
+            if itemset in support_dict:
+                count = support_dict[itemset] + gain
+                if count >= thr_new:
+                    large_itemsets.add(itemset)
+                    new_support_dict[itemset] = count
+            elif gain >= min_gain:
+                rescan.add(itemset)
+        retained_counts = count_retained(rescan)
+        for itemset in rescan:
+            count = retained_counts.get(itemset, 0) + added_counts.get(itemset, 0)
+            if count >= thr_new:
+                large_itemsets.add(itemset)
+                new_support_dict[itemset] = count
+        if max_large_item_len is not None and itemset_size == max_large_item_len:
+            break
+        itemset_size += 1
+        candidates = ap.join_itemsets_with_common_prefix(large_itemsets, itemset_size)
+    return new_support_dict, n_new
+
+class SlidingWindow:
+    """
+        Large itemsets over the last window_size batches
+
+        Batches of the window are kept in memory, so an expired batch can be
+        subtracted and the retained ones rescanned for promoted itemsets.
+    """
+    def __init__(self, window_size, min_support, max_large_item_len=None):
+        self.window_size = window_size
+        self.min_support = min_support
+        self.max_large_item_len = max_large_item_len
+        self.batches = deque()
+        self.support_dict = {}
+        self.n_transactions = 0
+
+    def add_batch(self, data_iter):
+        """
+            Append a batch, expiring the oldest one once the window is full
+
+            Return:
+                dict itemset -> support of the current window
+        """
+        batch = [frozenset(actionset) for actionset in data_iter]
+        removed = None
+        if len(self.batches) == self.window_size:
+            removed = self.batches.popleft()
+        retained = list(self.batches)
+        self.support_dict, self.n_transactions = update_large_itemsets(
+            self.support_dict, self.n_transactions, batch, self.min_support,
+            removed=removed, retained_data=lambda: chain.from_iterable(retained),
+            max_large_item_len=self.max_large_item_len)
+        self.batches.append(batch)
+        return self.support_dict
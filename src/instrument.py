@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+########################################################################
+#
+# Copyright (c) 2018 Wan Li. All Rights Reserved
+#
+########################################################################
+
+"""
+File: instrument.py
+Author: Wan Li
+Date: 2018/06/25 11:02:16
+"""
+
+import sys
+import json
+import time
+import logging
+from collections import defaultdict
+from contextlib import contextmanager
+try:
+    import resource
+except ImportError:
+    # Unix only, peak memory is then not reported
+    resource = None
+
+def get_peak_rss_kb():
+    """
+        Peak resident set size of this process in KB, None without resource
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        # bytes on macOS, KB on Linux
+        peak //= 1024
+    return peak
+
+class Phase:
+    """
+        Context manager adding its elapsed time to a phase timer
+    """
+    def __init__(self, instrument, name):
+        self.instrument = instrument
+        self.name = name
+        self.time_s = None
+
+    def __enter__(self):
+        self.time_s = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.time_s
+        self.instrument.timers[self.name] += elapsed
+        self.instrument.sample_memory(self.name)
+        self.instrument.event("phase", phase=self.name, seconds=elapsed)
+        return False
+
+class NullPhase:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NULL_PHASE = NullPhase()
+
+class NullInstrument:
+    """
+        Disabled instrumentation, every hook is a no-op
+    """
+    enabled = False
+
+    def phase(self, name):
+        return NULL_PHASE
+
+    def count(self, name, n=1):
+        pass
+
+    def maximum(self, name, value):
+        pass
+
+    def event(self, name, **fields):
+        pass
+
+    def sample_memory(self, phase=None):
+        pass
+
+class Instrument(NullInstrument):
+    """
+        Phase timers, counters and peak memory of a mining run
+
+        Phases: load, seed, candidate_gen, counting, tree_build,
+        conditional_mining, rule_gen. Miners report through the active
+        instrument, see activate; with workers only the in-process parts
+        are counted. Events go to callback(name, fields) and as debug
+        records to logger.
+
+        Params:
+            callback: optional function (event name, dict of fields)
+            logger: optional logging.Logger, or a logger name
+    """
+    enabled = True
+
+    def __init__(self, callback=None, logger=None):
+        self.callback = callback
+        if isinstance(logger, str):
+            logger = logging.getLogger(logger)
+        self.logger = logger
+        self.timers = defaultdict(float) # phase -> seconds
+        self.counters = defaultdict(int)
+        self.maxima = {}
+        self.peak_rss_kb = {} # phase -> peak rss at its end
+
+    def phase(self, name):
+        return Phase(self, name)
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def maximum(self, name, value):
+        if value > self.maxima.get(name, value - 1):
+            self.maxima[name] = value
+
+    def event(self, name, **fields):
+        if self.callback is not None:
+            self.callback(name, fields)
+        if self.logger is not None:
+            self.logger.debug("%s %s", name, fields)
+
+    def sample_memory(self, phase=None):
+        peak = get_peak_rss_kb()
+        if peak is None:
+            return
+        if phase is not None:
+            self.peak_rss_kb[phase] = peak
+        self.maximum("peak_rss_kb", peak)
+
+    def to_dict(self):
+        return {
+            "timers": dict(self.timers),
+            "counters": dict(self.counters),
+            "maxima": dict(self.maxima),
+            "peak_rss_kb": dict(self.peak_rss_kb),
+        }
+
+    def dump(self, fn="out_instrument.json"):
+        fd = open(fn, 'w')
+        json.dump(self.to_dict(), fd, indent=2, sort_keys=True)
+        fd.close()
+
+NULL_INSTRUMENT = NullInstrument()
+current = NULL_INSTRUMENT
+
+def get():
+    """
+        The active instrument, a no-op one when disabled
+    """
+    return current
+
+@contextmanager
+def activate(instrument):
+    """
+        Make instrument the active one within a with block
+
+        Params:
+            instrument: Instrument, None keeps the active one
+    """
+    global current
+    previous = current
+    if instrument is not None:
+        current = instrument
+    try:
+        yield current
+    finally:
+        current = previous
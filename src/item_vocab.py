@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+########################################################################
+#
+# Copyright (c) 2018 Wan Li. All Rights Reserved
+#
+########################################################################
+
+"""
+File: item_vocab.py
+Author: Wan Li
+Date: 2018/05/24 11:27:52
+"""
+
+from collections import defaultdict
+
+class ItemVocab:
+    """
+        Item name <-> dense int id mapping
+
+        Ids built by create_vocab_from_iterator are ranked by descending
+        frequency, unseen items met later are appended so saved ids stay stable.
+    """
+    def __init__(self, names=None):
+        self.names = [] # id -> name
+        self.ids = {} # name -> id
+        if names is not None:
+            for name in names:
+                self.add(name)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.ids
+
+    def add(self, name):
+        """
+            Return id of name, assign the next id if unseen
+        """
+        item_id = self.ids.get(name)
+        if item_id is None:
+            item_id = len(self.names)
+            self.ids[name] = item_id
+            self.names.append(name)
+        return item_id
+
+    def encode(self, actionset):
+        return frozenset([self.add(item) for item in actionset])
+
+    def encode_iter(self, data_iter):
+        for actionset in data_iter:
+            yield self.encode(actionset)
+
+    def decode(self, item_ids):
+        return tuple([self.names[i] for i in item_ids])
+
+    def update(self, data_iter):
+        """
+            Append unseen items of data_iter, most frequent first
+        """
+        item_count_dict = defaultdict(int)
+        for actionset in data_iter:
+            for item in actionset:
+                if item not in self.ids:
+                    item_count_dict[item] += 1
+        for name, count in sorted(item_count_dict.items(), key=lambda x: (-x[1], x[0])):
+            self.add(name)
+        return self
+
+    def save(self, fn):
+        """
+            One name per line, line number is the id
+        """
+        fd = open(fn, 'w')
+        for name in self.names:
+            fd.write(name)
+            fd.write('\n')
+        fd.close()
+
+def create_vocab_from_iterator(data_iter):
+    return ItemVocab().update(data_iter)
+
+def load_vocab(fn):
+    fd = open(fn, 'r')
+    vocab = ItemVocab([line.rstrip('\n') for line in fd])
+    fd.close()
+    return vocab
@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+########################################################################
+#
+# Copyright (c) 2018 Wan Li. All Rights Reserved
+#
+########################################################################
+
+"""
+File: itemset_store.py
+Author: Wan Li
+Date: 2018/06/04 15:21:36
+"""
+
+import os
+from array import array
+import numpy as np
+import item_vocab
+
+ITEMSETS = "itemsets"
+RULES = "rules"
+FN_KIND = "kind"
+FN_VOCAB = "vocab.txt"
+CHUNK_ROWS = 1 << 16 # rows converted from the mapped arrays at once
+
+def is_store(path, kind=None):
+    """
+        Whether path is a binary store directory, optionally of given kind
+    """
+    fn_kind = os.path.join(path, FN_KIND)
+    if not os.path.isfile(fn_kind):
+        return False
+    if kind is None:
+        return True
+    fd = open(fn_kind, 'r')
+    stored_kind = fd.read().strip()
+    fd.close()
+    return stored_kind == kind
+
+def create_store(path, kind, vocab):
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    vocab.save(os.path.join(path, FN_VOCAB))
+    fd = open(os.path.join(path, FN_KIND), 'w')
+    fd.write(kind)
+    fd.close()
+
+def encode_items(items, vocab, encoded, item_array):
+    if encoded:
+        item_array.extend(items)
+    else:
+        item_array.extend([vocab.add(item) for item in items])
+    return len(item_array)
+
+def save_array(path, name, values, dtype):
+    np.save(os.path.join(path, name + '.npy'), np.frombuffer(values, dtype=dtype))
+
+def load_array(path, name):
+    return np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+
+def split_rows(values, offsets, start, end, names=None, row_type=tuple):
+    """
+        Rows start..end of values as row_type
+
+        Each array is converted to a list once, rows are plain list slices.
+
+        Params:
+            names: list to map stored ids through, e.g. vocab names
+    """
+    offsets = offsets[start:end + 1].tolist()
+    first = offsets[0]
+    values = values[first:offsets[-1]].tolist()
+    if names is not None:
+        values = [names[j] for j in values]
+    return [row_type(values[offsets[i] - first:offsets[i + 1] - first]) for i in range(len(offsets) - 1)]
+
+def decode_confidences(confidences):
+    """
+        float32 confidences as floats of their shortest repr, one str per distinct value
+    """
+    uniques, inverse = np.unique(confidences, return_inverse=True)
+    values = np.array([float(str(c)) for c in uniques], dtype=np.float64)
+    return values[inverse].tolist()
+
+class ItemsetStore:
+    """
+        Memory mapped large itemsets
+
+        Itemset i holds items[offsets[i]:offsets[i + 1]] with supports[i],
+        items are ids of the stored vocab.
+    """
+    def __init__(self, path):
+        if not is_store(path, ITEMSETS):
+            raise ValueError("not an itemset store: {}".format(path))
+        self.vocab = item_vocab.load_vocab(os.path.join(path, FN_VOCAB))
+        self.items = load_array(path, "items")
+        self.offsets = load_array(path, "offsets")
+        self.supports = load_array(path, "supports")
+
+    def __len__(self):
+        return len(self.supports)
+
+    def item_ids(self, i):
+        return self.items[self.offsets[i]:self.offsets[i + 1]]
+
+    def __iter__(self):
+        """
+            Yield: (support, tuple of names)
+        """
+        names = self.vocab.names
+        for start in range(0, len(self), CHUNK_ROWS):
+            end = min(len(self), start + CHUNK_ROWS)
+            for item in zip(self.supports[start:end].tolist(),
+                split_rows(self.items, self.offsets, start, end, names)):
+                yield item
+
+    def to_support_dict(self, vocab=None):
+        """
+            Built straight from the arrays, stored ids are mapped once per item
+
+            Params:
+                vocab: encode items with vocab instead of keeping names
+        """
+        names = self.vocab.names
+        if vocab is not None:
+            names = [vocab.add(name) for name in names]
+        itemsets = split_rows(self.items, self.offsets, 0, len(self), names, frozenset)
+        return dict(zip(itemsets, self.supports.tolist()))
+
+class RuleStore:
+    """
+        Memory mapped recomm rules
+
+        Rule i is base_items[base_offsets[i]:base_offsets[i + 1]] =>
+        recom_items[recom_offsets[i]:recom_offsets[i + 1]] with float32 confidences[i].
+        Confidences are read back through their shortest float32 repr, so
+        simple ratios such as 0.6 compare equal to the csv values.
+    """
+    def __init__(self, path):
+        if not is_store(path, RULES):
+            raise ValueError("not a rule store: {}".format(path))
+        self.vocab = item_vocab.load_vocab(os.path.join(path, FN_VOCAB))
+        self.base_items = load_array(path, "base_items")
+        self.base_offsets = load_array(path, "base_offsets")
+        self.recom_items = load_array(path, "recom_items")
+        self.recom_offsets = load_array(path, "recom_offsets")
+        self.confidences = load_array(path, "confidences")
+
+    def __len__(self):
+        return len(self.confidences)
+
+    def __iter__(self):
+        """
+            Yield: (confidence, base names tuple, recom names tuple)
+        """
+        return self.yield_rules()
+
+    def yield_rules(self, row_type=tuple):
+        """
+            Yield: (confidence, base names, recom names), names as row_type
+        """
+        names = self.vocab.names
+        for start in range(0, len(self), CHUNK_ROWS):
+            end = min(len(self), start + CHUNK_ROWS)
+            for rule in zip(decode_confidences(self.confidences[start:end]),
+                split_rows(self.base_items, self.base_offsets, start, end, names, row_type),
+                split_rows(self.recom_items, self.recom_offsets, start, end, names, row_type)):
+                yield rule
+
+def save_itemsets(itemsets, path, vocab=None):
+    """
+        Params:
+            itemsets: iterable of (support, items) as returned by apriori.run,
+                or a support dict
+            vocab: item_vocab.ItemVocab the items are encoded with, None if
+                items are names
+    """
+    encoded = vocab is not None
+    if vocab is None:
+        vocab = item_vocab.ItemVocab()
+    if isinstance(itemsets, dict):
+        itemsets = ((sup, items) for items, sup in itemsets.items())
+    items = array('i')
+    offsets = array('q', [0])
+    supports = array('q')
+    for sup, itemset in itemsets:
+        offsets.append(encode_items(itemset, vocab, encoded, items))
+        supports.append(sup)
+    create_store(path, ITEMSETS, vocab)
+    save_array(path, "items", items, np.int32)
+    save_array(path, "offsets", offsets, np.int64)
+    save_array(path, "supports", supports, np.int64)
+
+def save_recom_rules(rules, path, vocab=None):
+    """
+        Params:
+            rules: iterable of (confidence, (base, recom)) as returned by
+                apriori.compute_recom_rules or apriori.generate_recom_rules
+            vocab: item_vocab.ItemVocab the items are encoded with, None if
+                items are names
+    """
+    encoded = vocab is not None
+    if vocab is None:
+        vocab = item_vocab.ItemVocab()
+    base_items = array('i')
+    base_offsets = array('q', [0])
+    recom_items = array('i')
+    recom_offsets = array('q', [0])
+    confidences = array('f')
+    for confidence, (base, recom) in rules:
+        base_offsets.append(encode_items(base, vocab, encoded, base_items))
+        recom_offsets.append(encode_items(recom, vocab, encoded, recom_items))
+        confidences.append(confidence)
+    create_store(path, RULES, vocab)
+    save_array(path, "base_items", base_items, np.int32)
+    save_array(path, "base_offsets", base_offsets, np.int64)
+    save_array(path, "recom_items", recom_items, np.int32)
+    save_array(path, "recom_offsets", recom_offsets, np.int64)
+    save_array(path, "confidences", confidences, np.float32)
+
+def yield_itemsets_from_csv(fn):
+    """
+        Read apriori.dump large itemsets csv, yield (support, items)
+    """
+    fd = open(fn, 'r')
+    for line in fd:
+        elems = line.strip().rstrip(',').split(',')
+        yield int(elems[0]), tuple(elems[1:])
+    fd.close()
+
+def yield_rules_from_csv(fn):
+    """
+        Read recomm rules csv, yield (confidence, (base, recom))
+    """
+    fd = open(fn, 'r')
+    for line in fd:
+        elems = line.strip().split(',')
+        yield float(elems[0]), (tuple(elems[1].split('|')), tuple(elems[2].split('|')))
+    fd.close()
+
+def convert_itemsets_csv_to_bin(fn, path):
+    save_itemsets(yield_itemsets_from_csv(fn), path)
+
+def convert_itemsets_bin_to_csv(path, fn):
+    fd = open(fn, 'w')
+    for sup, items in ItemsetStore(path):
+        fd.write(str(sup) + ',')
+        fd.write(','.join(items))
+        fd.write('\n')
+    fd.close()
+
+def convert_rules_csv_to_bin(fn, path):
+    save_recom_rules(yield_rules_from_csv(fn), path)
+
+def convert_rules_bin_to_csv(path, fn):
+    """
+        Confidences are written back from their float32 values
+    """
+    fd = open(fn, 'w')
+    for con, base, recom in RuleStore(path):
+        fd.write(str(con) + ',')
+        fd.write('|'.join(base) + ',')
+        fd.write('|'.join(recom))
+        fd.write('\n')
+    fd.close()
@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+########################################################################
+#
+# Copyright (c) 2018 Wan Li. All Rights Reserved
+#
+########################################################################
+
+"""
+File: loader.py
+Author: Wan Li
+Date: 2018/06/27 15:40:03
+"""
+
+import os
+import gzip
+import mmap
+import hashlib
+from array import array
+from itertools import accumulate, chain
+import numpy as np
+import item_vocab
+
+UID_SIDS = "uid_sids" # uid,sid|sid|...
+BASKET = "basket" # item,item,...
+BLOCK_SIZE = 1 << 22
+GZIP_MAGIC = b'\x1f\x8b'
+CACHE_VERSION = "2"
+DETECT_LINES = 1000 # lines sampled by detect_format
+
+class Transactions:
+    """
+        Actionsets in CSR form
+
+        Actionset i holds item ids indices[indptr[i]:indptr[i + 1]] of vocab,
+        ascending. Iterating yields frozensets of names like the line parsers,
+        so any miner taking data_iter can take Transactions, and more than once.
+        The encode() view yields the item ids instead, for miners decoding
+        with vocab on output only.
+    """
+    def __init__(self, indptr, indices, vocab, uids=None, encoded=False):
+        self.indptr = indptr
+        self.indices = indices
+        self.vocab = vocab
+        self.uids = uids
+        self.encoded = encoded
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def encode(self):
+        """
+            View of the same arrays iterating frozensets of item ids
+        """
+        return Transactions(self.indptr, self.indices, self.vocab, self.uids, encoded=True)
+
+    def item_keys(self):
+        """
+            Item id -> item as iterated, a name or the id itself once encoded
+        """
+        return range(len(self.vocab)) if self.encoded else self.vocab.names
+
+    def row(self, i):
+        return self.indices[self.indptr[i]:self.indptr[i + 1]]
+
+    def iter_encoded(self):
+        """
+            Yield: frozenset of item ids
+        """
+        indptr = self.indptr.tolist()
+        indices = self.indices.tolist()
+        for i in range(len(indptr) - 1):
+            yield frozenset(indices[indptr[i]:indptr[i + 1]])
+
+    def __iter__(self):
+        if self.encoded:
+            return self.iter_encoded()
+        return self.iter_names()
+
+    def iter_names(self):
+        names = self.vocab.names
+        indptr = self.indptr.tolist()
+        indices = self.indices.tolist()
+        for i in range(len(indptr) - 1):
+            yield frozenset([names[j] for j in indices[indptr[i]:indptr[i + 1]]])
+
+    def yield_uid_sids(self):
+        """
+            Yield: (uid, frozenset of names or ids as iterated), as recomm.yield_uid_sids
+        """
+        if self.uids is None:
+            raise ValueError("transactions were not loaded with uids")
+        for uid, actionset in zip(self.uids, self):
+            yield uid, actionset
+
+    def item_counts(self):
+        """
+            Support of every item id
+        """
+        return np.bincount(self.indices, minlength=len(self.vocab))
+
+def is_gzip(fn):
+    fd = open(fn, 'rb')
+    magic = fd.read(2)
+    fd.close()
+    return magic == GZIP_MAGIC
+
+def yield_blocks(fn, block_size=BLOCK_SIZE, use_mmap=False):
+    """
+        Read fn in blocks of whole lines
+
+        Params:
+            use_mmap: map a plain file instead of reading it, ignored for gzip
+        Yield:
+            bytes ending at a line boundary
+    """
+    if is_gzip(fn):
+        fd = gzip.open(fn, 'rb')
+    else:
+        fd = open(fn, 'rb')
+    try:
+        if use_mmap and not isinstance(fd, gzip.GzipFile) and os.path.getsize(fn) > 0:
+            mm = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                pos = 0
+                while pos < len(mm):
+                    end = mm.rfind(b'\n', pos, pos + block_size) + 1
+                    if end <= pos:
+                        # line longer than a block
+                        end = mm.find(b'\n', pos + block_size) + 1 or len(mm)
+                    yield mm[pos:end]
+                    pos = end
+            finally:
+                mm.close()
+            return
+        rest = b''
+        while True:
+            block = fd.read(block_size)
+            if len(block) == 0:
+                break
+            end = block.rfind(b'\n') + 1
+            if end == 0:
+                rest += block
+                continue
+            yield rest + block[:end]
+            rest = block[end:]
+        if len(rest) > 0:
+            yield rest
+    finally:
+        fd.close()
+
+def detect_format(fn):
+    """
+        Format of the first DETECT_LINES lines of fn
+
+        A line with a '|' after its first ',' can only be uid_sids, one without
+        a ',' or with more than one can only be a basket. Lines of exactly one
+        ',' and no '|' fit both, so raise ValueError unless the sample shows
+        one format, an empty file is a basket.
+    """
+    uid_sids = basket = False
+    for block in yield_blocks(fn, 1 << 16):
+        lines = [line.strip().rstrip(b',') for line in block.split(b'\n')[:DETECT_LINES]]
+        for line in lines:
+            if len(line) == 0:
+                continue
+            if b'|' in line.partition(b',')[2]:
+                uid_sids = True
+            elif line.count(b',') != 1:
+                basket = True
+        break
+    if uid_sids and basket:
+        raise ValueError("{} mixes uid_sids and basket lines, pass fmt".format(fn))
+    if uid_sids:
+        return UID_SIDS
+    if basket or os.path.getsize(fn) == 0:
+        return BASKET
+    raise ValueError("cannot tell uid_sids from basket lines of {}, pass fmt".format(fn))
+
+def parse_block(text, fmt, vocab, indptr, indices, uids):
+    """
+        Tokenize lines of text, intern items into vocab and append CSR rows
+
+        Rows are appended as read, sort_rows orders and dedupes them at the end.
+    """
+    lines = [line for line in [line.strip() for line in text.split('\n')] if len(line) > 0]
+    if fmt == UID_SIDS:
+        pairs = [line.partition(',') for line in lines]
+        uids.extend([pair[0] for pair in pairs])
+        rows = [pair[2].split('|') for pair in pairs]
+    else:
+        rows = [line.rstrip(',').split(',') for line in lines]
+    tokens = list(chain.from_iterable(rows))
+    item_ids = vocab.ids
+    for token in dict.fromkeys(tokens):
+        if token not in item_ids:
+            vocab.add(token)
+    indices.extend(map(item_ids.__getitem__, tokens))
+    offset = indptr[-1]
+    indptr.extend([offset + end for end in accumulate(map(len, rows))])
+
+def rank_items(indices, local_vocab, vocab):
+    """
+        Map ids of local_vocab into vocab
+
+        Items new to vocab are appended by descending support, ties by name,
+        as item_vocab.ItemVocab.update would.
+
+        Params:
+            indices: deduped rows of local ids
+    """
+    counts = np.bincount(indices, minlength=len(local_vocab)).tolist()
+    names = local_vocab.names
+    new_ids = [i for i in range(len(names)) if names[i] not in vocab]
+    for i in sorted(new_ids, key=lambda i: (-counts[i], names[i])):
+        vocab.add(names[i])
+    remap = np.array([vocab.ids[name] for name in names], dtype=np.int32)
+    return remap[indices] if len(indices) > 0 else indices
+
+def sort_rows(indptr, indices, n_items):
+    """
+        Sort item ids within each row and drop repeated ones
+    """
+    n_rows = len(indptr) - 1
+    # one sort over row major keys orders rows and their items at once
+    keys = np.repeat(np.arange(n_rows, dtype=np.int64) * max(1, n_items), np.diff(indptr))
+    keys += indices
+    keys.sort()
+    keep = np.ones(len(keys), dtype=bool)
+    keep[1:] = keys[1:] != keys[:-1]
+    keys = keys[keep]
+    row_ids, indices = np.divmod(keys, max(1, n_items))
+    indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(row_ids, minlength=n_rows), out=indptr[1:])
+    return indptr, indices.astype(np.int32)
+
+def get_cache_fn(fn, fmt, cache_dir):
+    stat = os.stat(fn)
+    key = "{}|{}|{}|{}|{}".format(os.path.abspath(fn), stat.st_mtime_ns, stat.st_size, fmt, CACHE_VERSION)
+    digest = hashlib.md5(key.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(cache_dir, "{}.{}.npz".format(os.path.basename(fn), digest))
+
+def join_names(names):
+    return np.frombuffer('\n'.join(names).encode('utf-8'), dtype=np.uint8)
+
+def split_names(buf):
+    text = buf.tobytes().decode('utf-8')
+    return text.split('\n') if len(text) > 0 else []
+
+def save_cache(fn_cache, transactions):
+    cache_dir = os.path.dirname(fn_cache)
+    if len(cache_dir) > 0 and not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    uids = transactions.uids
+    # write aside and rename, a reader never sees a partial cache
+    fn_tmp = fn_cache + ".tmp.npz"
+    np.savez(fn_tmp, indptr=transactions.indptr, indices=transactions.indices,
+        names=join_names(transactions.vocab.names), has_uids=np.array([uids is not None]),
+        uids=join_names(uids if uids is not None else []))
+    os.replace(fn_tmp, fn_cache)
+
+def load_cache(fn_cache, vocab=None):
+    data = np.load(fn_cache)
+    indptr, indices = data["indptr"], data["indices"]
+    names = split_names(data["names"])
+    uids = split_names(data["uids"]) if data["has_uids"][0] else None
+    data.close()
+    if vocab is None:
+        return Transactions(indptr, indices, item_vocab.ItemVocab(names), uids)
+    # cached ids are local to the cached names, map them into vocab as load does
+    indices = rank_items(indices, item_vocab.ItemVocab(names), vocab)
+    indptr, indices = sort_rows(indptr, indices, len(vocab))
+    return Transactions(indptr, indices, vocab, uids)
+
+def load(fn, fmt=None, vocab=None, block_size=BLOCK_SIZE, use_mmap=False, cache_dir=None):
+    """
+        Parse a transaction file into Transactions
+
+        Params:
+            fn: plain or gzip file
+            fmt: "uid_sids" or "basket", detected by detect_format if None;
+                pass it for files whose lines all hold one ',' and no '|'
+            vocab: optional item_vocab.ItemVocab to intern items into, new
+                items get ids by descending support
+            use_mmap: map a plain file instead of reading it in blocks
+            cache_dir: keep parsed arrays there, reused while fn keeps its
+                mtime and size
+    """
+    if fmt is None:
+        fmt = detect_format(fn)
+    if fmt not in (UID_SIDS, BASKET):
+        raise ValueError("unknown format: {}".format(fmt))
+    fn_cache = None
+    if cache_dir is not None:
+        fn_cache = get_cache_fn(fn, fmt, cache_dir)
+        if os.path.isfile(fn_cache):
+            return load_cache(fn_cache, vocab)
+    if vocab is None:
+        vocab = item_vocab.ItemVocab()
+    # items are interned in order of first occurrence, ranked once supports are known
+    local_vocab = item_vocab.ItemVocab()
+    indptr = array('q', [0])
+    indices = array('i')
+    uids = [] if fmt == UID_SIDS else None
+    for block in yield_blocks(fn, block_size, use_mmap):
+        parse_block(block.decode('utf-8'), fmt, local_vocab, indptr, indices, uids)
+    indptr, indices = sort_rows(np.frombuffer(indptr, dtype=np.int64),
+        np.frombuffer(indices, dtype=np.int32), len(local_vocab))
+    indices = rank_items(indices, local_vocab, vocab)
+    indptr, indices = sort_rows(indptr, indices, len(vocab))
+    transactions = Transactions(indptr, indices, vocab, uids)
+    if fn_cache is not None:
+        save_cache(fn_cache, transactions)
+    return transactions
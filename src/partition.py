@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+########################################################################
+#
+# Copyright (c) 2018 Wan Li. All Rights Reserved
+#
+########################################################################
+
+"""
+File: partition.py
+Author: Wan Li
+Date: 2018/05/28 16:40:09
+"""
+
+from collections import defaultdict
+import freq_patt_tree as fp
+import eclat
+import bitmap
+
+def create_data_factory(data):
+    """
+        Return a callable yielding a fresh actionset iterator per pass
+
+        Params:
+            data: callable returning an iterator, or a re-iterable such as a list
+    """
+    if callable(data):
+        return data
+    if iter(data) is data:
+        raise ValueError("partitioned mining reads the data twice, "
+            "pass a callable such as lambda: util.yield_actionsets_from_file(fn)")
+    return lambda: iter(data)
+
+def yield_chunks(data_iter, chunk_size):
+    chunk = []
+    for actionset in data_iter:
+        chunk.append(frozenset(actionset))
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        yield chunk
+
+def compute_local_itemsets(chunk, min_sup, max_large_item_len=None):
+    """
+        Large itemsets of one chunk
+    """
+    if max_large_item_len is not None:
+        vertical_db = eclat.create_vertical_db(chunk, min_sup)
+        return eclat.compute_large_itemsets(vertical_db, min_sup,
+            max_large_item_len=max_large_item_len)
+    root, header = fp.create_tree(chunk, min_sup)
+    return fp.compute_large_itemsets(root, header, min_sup)
+
+def count_candidates(chunk, candidates):
+    """
+        Exact support of every candidate within chunk
+    """
+    items = set()
+    for itemset in candidates:
+        items.update(itemset)
+    tid_bitmaps = bitmap.create_tid_bitmaps(chunk, items)
+    count_dict = {}
+    for itemset in candidates:
+        count = bitmap.popcount(bitmap.intersect(itemset, tid_bitmaps))
+        if count > 0:
+            count_dict[itemset] = count
+    return count_dict
+
+def compute_large_itemsets(data_factory, min_support, chunk_size, n_transactions=None,
+    max_large_item_len=None):
+    """
+        SON partitioned mining, peak memory is bounded by chunk_size actionsets
+
+        An itemset large in the whole data is large in at least one chunk at the
+        threshold scaled by chunk length, so the union of local large itemsets
+        is a complete candidate set, counted exactly in a second pass.
+
+        Params:
+            data_factory: callable returning a fresh actionset iterator
+            min_support: absolute support over the whole data
+            n_transactions: total actionsets, counted in an extra pass if None
+        Return:
+            dict itemset -> support
+    """
+    if n_transactions is None:
+        n_transactions = sum(1 for _ in data_factory())
+    if n_transactions == 0:
+        return {}
+    # pass 1: local large itemsets
+    candidates = set()
+    for chunk in yield_chunks(data_factory(), chunk_size):
+        # ceil(min_support * len(chunk) / n_transactions)
+        local_min_sup = max(1, -(-min_support * len(chunk) // n_transactions))
+        candidates.update(compute_local_itemsets(chunk, local_min_sup,
+            max_large_item_len=max_large_item_len).keys())
+    # pass 2: exact global count of candidate union
+    count_dict = defaultdict(int)
+    for chunk in yield_chunks(data_factory(), chunk_size):
+        for itemset, count in count_candidates(chunk, candidates).items():
+            count_dict[itemset] += count
+    support_dict = defaultdict(int)
+    for itemset, count in count_dict.items():
+        if count >= min_support:
+            support_dict[itemset] = count
+    return support_dict
@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+########################################################################
+#
+# Copyright (c) 2018 Wan Li. All Rights Reserved
+#
+########################################################################
+
+"""
+File: prefix_span.py
+Author: Wan Li
+Date: 2018/07/02 10:26:44
+"""
+
+import datetime
+from bisect import bisect_right
+from collections import defaultdict, deque
+import fup
+
+DATE_FORMAT = "%Y-%m-%d"
+
+def yield_dated_sequences(fn):
+    """
+        Read date,action|action|... lines, actions in order of occurrence
+
+        Actions may hold commas, only the first one separates the date.
+
+        Yield:
+            (date string, tuple of actions)
+    """
+    with open(fn, 'r') as fd:
+        for line in fd:
+            line = line.rstrip('\r\n')
+            if len(line) == 0:
+                continue
+            date, _, actions = line.partition(',')
+            yield date, tuple([action for action in actions.split('|') if len(action) > 0])
+
+def yield_days(dated_sequences):
+    """
+        Group consecutive sequences of the same date
+
+        Yield:
+            (date string, list of sequences)
+    """
+    cur_date = None
+    sequences = []
+    for date, sequence in dated_sequences:
+        if date != cur_date and len(sequences) > 0:
+            yield cur_date, sequences
+            sequences = []
+        cur_date = date
+        sequences.append(sequence)
+    if len(sequences) > 0:
+        yield cur_date, sequences
+
+def create_position_index(sequence):
+    """
+        Return: dict item -> ascending offsets of item in sequence
+    """
+    index = defaultdict(list)
+    for pos, item in enumerate(sequence):
+        index[item].append(pos)
+    return dict(index)
+
+def project(positions, ends, max_gap=None):
+    """
+        End offsets of prefix + item in one sequence
+
+        Params:
+            positions: offsets of item in the sequence
+            ends: ascending end offsets of prefix, -1 for the empty prefix
+            max_gap: most offsets between consecutive pattern items, None for any
+        Return:
+            tuple of end offsets, empty if prefix + item does not occur
+    """
+    if max_gap is None or ends[0] < 0:
+        # without a gap limit the earliest end dominates every later one
+        if max_gap is None:
+            i = bisect_right(positions, ends[0])
+            return (positions[i],) if i < len(positions) else ()
+        return tuple(positions)
+    new_ends = set()
+    for end in ends:
+        i = bisect_right(positions, end)
+        while i < len(positions) and positions[i] <= end + max_gap:
+            new_ends.add(positions[i])
+            i += 1
+    return tuple(sorted(new_ends))
+
+class DayProjections:
+    """
+        Sequences of one day with their prefix projections
+
+        A projection is a list of (sequence id, end offsets of the prefix), the
+        sequences themselves are never copied. Projections and extension counts
+        are cached per prefix, so every window holding this day reuses them.
+    """
+    def __init__(self, date, sequences, max_gap=None):
+        self.date = date
+        self.sequences = sequences
+        self.indexes = [create_position_index(sequence) for sequence in sequences]
+        self.max_gap = max_gap
+        self.projections = {(): [(i, (-1,)) for i in range(len(sequences))]}
+        self.extension_counts = {}
+
+    def __len__(self):
+        return len(self.sequences)
+
+    def projection(self, prefix):
+        projection = self.projections.get(prefix)
+        if projection is not None:
+            return projection
+        parent = self.projection(prefix[:-1])
+        item = prefix[-1]
+        projection = []
+        for seq_id, ends in parent:
+            positions = self.indexes[seq_id].get(item)
+            if positions is None:
+                continue
+            new_ends = project(positions, ends, self.max_gap)
+            if len(new_ends) > 0:
+                projection.append((seq_id, new_ends))
+        self.projections[prefix] = projection
+        return projection
+
+    def count_extensions(self, prefix):
+        """
+            Return: dict item -> sequences where prefix + item occurs
+        """
+        counts = self.extension_counts.get(prefix)
+        if counts is not None:
+            return counts
+        counts = defaultdict(int)
+        for seq_id, ends in self.projection(prefix):
+            if self.max_gap is None or ends[0] < 0:
+                first_end = ends[0]
+                for item, positions in self.indexes[seq_id].items():
+                    if positions[-1] > first_end:
+                        counts[item] += 1
+            else:
+                sequence = self.sequences[seq_id]
+                items = set()
+                for end in ends:
+                    for pos in range(end + 1, min(len(sequence), end + 1 + self.max_gap)):
+                        items.add(sequence[pos])
+                for item in items:
+                    counts[item] += 1
+        counts = dict(counts)
+        self.extension_counts[prefix] = counts
+        return counts
+
+def mine_days(days, min_sup, max_pattern_len=None):
+    """
+        PrefixSpan over the sequences of days, depth first from an explicit stack
+
+        Return:
+            dict pattern tuple -> number of sequences holding it
+    """
+    patterns = {}
+    stack = [()]
+    while len(stack) > 0:
+        prefix = stack.pop()
+        counts = defaultdict(int)
+        for day in days:
+            for item, count in day.count_extensions(prefix).items():
+                counts[item] += count
+        for item in sorted(counts.keys(), reverse=True):
+            if counts[item] < min_sup:
+                continue
+            pattern = prefix + (item,)
+            patterns[pattern] = counts[item]
+            if max_pattern_len is None or len(pattern) < max_pattern_len:
+                stack.append(pattern)
+    return patterns
+
+def compute_sequential_patterns(sequences, min_support, max_gap=None, max_pattern_len=None):
+    """
+        Frequent sequential patterns of sequences
+
+        Params:
+            min_support: absolute count, or a float below 1 as fraction of sequences
+            max_gap: most offsets between consecutive pattern items, None for any
+        Return:
+            dict pattern tuple -> support
+    """
+    sequences = [tuple(sequence) for sequence in sequences]
+    min_sup = fup.compute_threshold(min_support, len(sequences))
+    return mine_days([DayProjections(None, sequences, max_gap)], min_sup, max_pattern_len)
+
+class SlidingWindow:
+    """
+        Sequential patterns over the sequences of the last window_days days
+
+        Days are kept with their projections, so a new window only projects
+        the new day and reuses every prefix already projected on the others.
+    """
+    def __init__(self, window_days, min_support, max_gap=None, max_pattern_len=None):
+        self.window_days = window_days
+        self.min_support = min_support
+        self.max_gap = max_gap
+        self.max_pattern_len = max_pattern_len
+        self.days = deque()
+
+    def add_day(self, date, sequences):
+        """
+            Params:
+                date: date string as DATE_FORMAT, later than every added day
+            Return:
+                dict pattern tuple -> support of the current window
+        """
+        day = datetime.datetime.strptime(date, DATE_FORMAT).date()
+        first_day = day - datetime.timedelta(days=self.window_days - 1)
+        while len(self.days) > 0 and self.days[0].date < first_day:
+            self.days.popleft()
+        self.days.append(DayProjections(day, [tuple(sequence) for sequence in sequences],
+            self.max_gap))
+        n_sequences = sum(len(d) for d in self.days)
+        min_sup = fup.compute_threshold(self.min_support, n_sequences)
+        return mine_days(self.days, min_sup, self.max_pattern_len)
+
+def yield_window_patterns(fn, window_days, min_support, max_gap=None, max_pattern_len=None):
+    """
+        Stream a dated action file, mining the window ending at every day
+
+        Yield:
+            (date string, dict pattern tuple -> support)
+    """
+    window = SlidingWindow(window_days, min_support, max_gap, max_pattern_len)
+    for date, sequences in yield_days(yield_dated_sequences(fn)):
+        yield date, window.add_day(date, sequences)
+
+
+if __name__ == "__main__":
+    for date, patterns in yield_window_patterns('time_action_sample.csv', 7, 0.5, max_gap=2,
+        max_pattern_len=3):
+        print(date, len(patterns))
@@ -12,31 +12,53 @@ Author: Wan Li
 Date: 2018/05/10 18:36:03
 """
 
+import heapq
+import multiprocessing
 from collections import defaultdict
+import numpy as np
+import itemset_store
+import loader
+
+worker_rule_index = None # RuleIndex shared by every task of a pool worker
+worker_vocab = None # item_vocab.ItemVocab the worker's rules are encoded with, None for names
 
 def yield_recom_rules(fn):
     """
         Rule iterator generator
+
+        Params:
+            fn: rules csv, or itemset_store binary rule store
     """
-    fd = open(fn, "r")
-    for line in fd:
-        elems = line.strip().split(',')
-        confidence = elems[0]
-        base = frozenset(elems[1].split('|'))
-        recom = frozenset(elems[2].split('|'))
-        yield confidence, base, recom
+    if itemset_store.is_store(fn, itemset_store.RULES):
+        for rule in itemset_store.RuleStore(fn).yield_rules(frozenset):
+            yield rule
+        return
+    with open(fn, "r") as fd:
+        for line in fd:
+            elems = line.strip().split(',')
+            confidence = elems[0]
+            base = frozenset(elems[1].split('|'))
+            recom = frozenset(elems[2].split('|'))
+            yield confidence, base, recom
 
 
 def yield_uid_sids(fn):
     """
         Uid sids iterator generator
+
+        Params:
+            fn: uid,sid|sid|... file, or loader.Transactions loaded from one
     """
-    fd = open(fn, "r")
-    for line in fd:
-        elems = line.strip().split(',')
-        uid = elems[0]
-        sids = frozenset(elems[1].split('|'))
-        yield uid, sids
+    if isinstance(fn, loader.Transactions):
+        for uid, sids in fn.yield_uid_sids():
+            yield uid, sids
+        return
+    with open(fn, "r") as fd:
+        for line in fd:
+            elems = line.strip().split(',')
+            uid = elems[0]
+            sids = frozenset(elems[1].split('|'))
+            yield uid, sids
 
 
 def build_recom_rules(recom_iter):
@@ -49,36 +71,329 @@ def build_recom_rules(recom_iter):
     return recom
 
 
+class RuleIndex:
+    """
+        Inverted index of recomm rules
+
+        Every rule is filed under the rarest item of its antecedent, so a user
+        only visits rules sharing that item and each rule is visited once.
+        Confidences are parsed to float up front, and every posting list is
+        ordered by descending confidence for match_by_confidence.
+    """
+    def __init__(self, recom_iter):
+        self.rules = [] # rule id -> (confidence, base, recom)
+        for c, b, r in recom_iter:
+            self.rules.append((float(c), b, r))
+        item_count_dict = defaultdict(int)
+        for c, b, r in self.rules:
+            for sid in b:
+                item_count_dict[sid] += 1
+        self.index = defaultdict(list) # sid -> rule ids, ascending
+        for rule_id, (c, b, r) in enumerate(self.rules):
+            key = min(b, key=lambda sid: (item_count_dict[sid], sid))
+            self.index[key].append(rule_id)
+        for rule_ids in self.index.values():
+            rule_ids.sort(key=lambda rule_id: (-self.rules[rule_id][0], rule_id))
+
+    def __len__(self):
+        return len(self.rules)
+
+    def __iter__(self):
+        return iter(self.rules)
+
+    def match(self, sids):
+        """
+            Rules whose antecedent is a subset of sids, in rule file order
+        """
+        rule_ids = []
+        for sid in sids:
+            if sid in self.index:
+                rule_ids.extend(self.index[sid])
+        rule_ids.sort()
+        for rule_id in rule_ids:
+            rule = self.rules[rule_id]
+            if rule[1].issubset(sids):
+                yield rule
+
+    def match_by_confidence(self, sids):
+        """
+            Rules whose antecedent is a subset of sids, by descending confidence
+
+            Posting lists are merged lazily, a consumer stopping early never
+            visits the weaker rules.
+        """
+        rules = self.rules
+        postings = [self.index[sid] for sid in sids if sid in self.index]
+        for rule_id in heapq.merge(*postings, key=lambda rule_id: (-rules[rule_id][0], rule_id)):
+            rule = rules[rule_id]
+            if rule[1].issubset(sids):
+                yield rule
+
+
+def create_rule_index_from_store(store):
+    """
+        RuleIndex of an itemset_store.RuleStore, keyed and sorted on its arrays
+
+        Same rules and posting lists as RuleIndex(yield_recom_rules(path)),
+        only the rules themselves are built per row.
+    """
+    rule_index = RuleIndex([])
+    rule_index.rules = list(store.yield_rules(frozenset))
+    if len(rule_index.rules) == 0:
+        return rule_index
+    names = store.vocab.names
+    base_items = np.asarray(store.base_items)
+    base_offsets = np.asarray(store.base_offsets)
+    item_counts = np.bincount(base_items, minlength=len(names))
+    # rank of every item by (rule count, name), the rarest antecedent item has the lowest
+    order = sorted(range(len(names)), key=lambda i: (item_counts[i], names[i]))
+    rank = np.empty(len(names), dtype=np.int64)
+    rank[order] = np.arange(len(names))
+    key_ranks = np.minimum.reduceat(rank[base_items], base_offsets[:-1])
+    confidences = np.array([rule[0] for rule in rule_index.rules], dtype=np.float64)
+    rule_ids = np.lexsort((np.arange(len(confidences)), -confidences, key_ranks))
+    key_ranks = key_ranks[rule_ids]
+    bounds = np.flatnonzero(key_ranks[1:] != key_ranks[:-1]) + 1
+    starts = [0] + bounds.tolist()
+    ends = bounds.tolist() + [len(rule_ids)]
+    rule_ids = rule_ids.tolist()
+    key_ranks = key_ranks.tolist()
+    for start, end in zip(starts, ends):
+        rule_index.index[names[order[key_ranks[start]]]] = rule_ids[start:end]
+    return rule_index
+
+
+def encode_recom_rules(recom_iter, vocab):
+    """
+        Rules with items as ids of vocab
+
+        A rule whose antecedent holds an item unknown to vocab can never
+        match and is dropped, unknown consequent items are added to vocab.
+    """
+    item_ids = vocab.ids
+    for c, b, r in recom_iter:
+        if all(sid in item_ids for sid in b):
+            yield c, frozenset([item_ids[sid] for sid in b]), vocab.encode(r)
+
+
+def create_rule_index(fn, vocab=None):
+    """
+        RuleIndex of a rules csv or binary rule store
+
+        Params:
+            vocab: encode rules with vocab, for users of encoded sids
+    """
+    if vocab is not None:
+        return RuleIndex(encode_recom_rules(yield_recom_rules(fn), vocab))
+    if itemset_store.is_store(fn, itemset_store.RULES):
+        return create_rule_index_from_store(itemset_store.RuleStore(fn))
+    return RuleIndex(yield_recom_rules(fn))
+
+
 def associate_recom(sids, recom_rules):
     """
         Make recomm for single user
+
+        Params:
+            recom_rules: list of rules or RuleIndex
     """
     recoms = defaultdict(int) # sid -> confidence
     reason = defaultdict(str)
+    if isinstance(recom_rules, RuleIndex):
+        recom_rules = recom_rules.match(sids)
     for c, b, r in recom_rules:
         if b.issubset(sids):
+            c = float(c)
             for sid in b:
-                if recoms[sid] < float(c):
-                    recoms[sid] = round(float(c), 2)
+                if recoms[sid] < c:
+                    recoms[sid] = round(c, 2)
                     reason[sid] = b
     return recoms, reason
 
 
-def recommend(fn_uid_sids, fn_recom_rules):
+AGGREGATIONS = ("max", "sum", "noisy_or")
+
+def score_recom(sids, recom_rules, top_n, aggregation="max", names=None):
+    """
+        Make top-N recomm of consequent items for single user
+
+        Items of a matching rule's consequent the user does not own are
+        scored over every matching rule by the highest confidence ("max"),
+        the confidence sum ("sum") or 1 - prod(1 - confidence) ("noisy_or").
+        With "max" and a RuleIndex, rules are visited by descending confidence
+        and the scan stops once top_n items are scored.
+
+        Params:
+            recom_rules: list of rules or RuleIndex
+            top_n: number of items to keep
+            names: id -> name if sids are encoded, equal scores are ranked by name
+        Return:
+            dict sid -> score rounded to 2 digits, best first, dict sid -> antecedent
+            of its strongest rule
+    """
+    if aggregation not in AGGREGATIONS:
+        raise ValueError("unknown aggregation: {}".format(aggregation))
+    scores = {}
+    reason = {}
+    best = {} # sid -> confidence of its strongest rule
+    early_stop = aggregation == "max" and isinstance(recom_rules, RuleIndex)
+    if early_stop:
+        recom_rules = recom_rules.match_by_confidence(sids)
+    elif isinstance(recom_rules, RuleIndex):
+        recom_rules = recom_rules.match(sids)
+    stop_confidence = None
+    for c, b, r in recom_rules:
+        if not b.issubset(sids):
+            continue
+        c = float(c)
+        if stop_confidence is not None and c < stop_confidence:
+            # every scored item beats this and any weaker rule, ties included
+            break
+        for sid in r:
+            if sid in sids:
+                continue
+            if sid not in scores:
+                scores[sid] = c if aggregation != "noisy_or" else 1.0 - c
+                best[sid] = c
+                reason[sid] = b
+                continue
+            if aggregation == "max":
+                scores[sid] = max(scores[sid], c)
+            elif aggregation == "sum":
+                scores[sid] += c
+            else:
+                scores[sid] *= 1.0 - c # probability that no rule fires
+            if c > best[sid]:
+                best[sid] = c
+                reason[sid] = b
+        if early_stop and stop_confidence is None and len(scores) >= top_n:
+            stop_confidence = c
+    if aggregation == "noisy_or":
+        for sid in scores:
+            scores[sid] = 1.0 - scores[sid]
+    if names is None:
+        top = heapq.nsmallest(top_n, scores.items(), key=lambda x: (-x[1], x[0]))
+    else:
+        top = heapq.nsmallest(top_n, scores.items(), key=lambda x: (-x[1], names[x[0]]))
+    recoms = dict([(sid, round(score, 2)) for sid, score in top])
+    return recoms, dict([(sid, reason[sid]) for sid in recoms])
+
+
+def format_recom(uid, recoms, reason):
+    recom_str = "|".join([":".join([k, str(v), "&".join(reason[k])]) \
+                          for k, v in recoms.items()])
+    return "{},{}".format(uid, recom_str)
+
+
+def yield_uid_sids_chunks(uid_sids_iter, chunk_size):
+    chunk = []
+    for uid, sids in uid_sids_iter:
+        chunk.append((uid, sids))
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        yield chunk
+
+
+def init_recom_worker(fn_recom_rules, vocab=None):
+    """
+        Pool initializer, load the rule index once per worker
+    """
+    global worker_rule_index, worker_vocab
+    worker_rule_index = create_rule_index(fn_recom_rules, vocab)
+    worker_vocab = vocab
+
+
+def decode_recom(recoms, reason, vocab):
+    names = vocab.names
+    return dict([(names[sid], score) for sid, score in recoms.items()]), \
+        dict([(names[sid], frozenset([names[i] for i in base])) for sid, base in reason.items()])
+
+
+def recommend_chunk(chunk, recom_rules=None, return_results=False, top_n=None, aggregation="max",
+    vocab=None):
+    """
+        Make recomm for a chunk of (uid, sids)
+
+        Params:
+            top_n: None for every antecedent item as associate_recom, otherwise
+                the top_n consequent items of score_recom
+            vocab: item_vocab.ItemVocab of encoded sids and rules, results are
+                decoded to names
+        Return:
+            list of (output line, (uid, recoms, reason) or None)
+    """
+    if recom_rules is None:
+        recom_rules, vocab = worker_rule_index, worker_vocab
+    names = vocab.names if vocab is not None else None
+    results = []
+    for uid, sids in chunk:
+        if top_n is None:
+            recoms, reason = associate_recom(sids, recom_rules)
+        else:
+            recoms, reason = score_recom(sids, recom_rules, top_n, aggregation, names)
+        if vocab is not None:
+            recoms, reason = decode_recom(recoms, reason, vocab)
+        results.append((format_recom(uid, recoms, reason),
+            tuple([uid, recoms, reason]) if return_results else None))
+    return results
+
+
+def recommend_chunk_task(task):
+    chunk, return_results, top_n, aggregation = task
+    return recommend_chunk(chunk, return_results=return_results, top_n=top_n, aggregation=aggregation)
+
+
+def recommend(fn_uid_sids, fn_recom_rules, return_results=False, workers=None, chunk_size=1000,
+    top_n=None, aggregation="max"):
     """
         Produce recommendation
+
+        Users are streamed in chunks and written in input order, only the
+        current chunks are held in memory.
+
+        Params:
+            fn_uid_sids: uid,sid|sid|... file, or loader.Transactions loaded from one,
+                matched as item ids with the rules encoded into its vocab
+            return_results: also collect and return (uid, recoms, reason) of every user
+            workers: number of processes, None or 1 runs in process
+            chunk_size: users per task
+            top_n: write the top_n unowned consequent items per user instead of
+                every matched antecedent item
+            aggregation: top_n only, "max", "sum" or "noisy_or" over matching rules
+        Return:
+            list of (uid, recoms, reason) if return_results, otherwise None
     """
-    recomms = []
+    recomms = [] if return_results else None
     fd = open('out_user_recom.txt', 'w')
-    recom_rules = build_recom_rules(yield_recom_rules(fn_recom_rules))
-    for uid, sids in yield_uid_sids(fn_uid_sids):
-        recoms, reason = associate_recom(sids, recom_rules)
-        recom_str = "|".join([":".join([k, str(v), "&".join(reason[k])]) \
-                              for k, v in recoms.items()])
-        fd.write("{},{}".format(uid, recom_str))
-        fd.write("\n")
-        recomms.append(tuple([uid, recoms, reason]))
-    fd.close()
+    vocab = None
+    if isinstance(fn_uid_sids, loader.Transactions) and not fn_uid_sids.encoded:
+        vocab = fn_uid_sids.vocab
+        fn_uid_sids = fn_uid_sids.encode()
+    chunks = yield_uid_sids_chunks(yield_uid_sids(fn_uid_sids), chunk_size)
+    pool = None
+    if workers is not None and workers > 1:
+        pool = multiprocessing.Pool(workers, initializer=init_recom_worker,
+            initargs=(fn_recom_rules, vocab))
+        results = pool.imap(recommend_chunk_task,
+            ((chunk, return_results, top_n, aggregation) for chunk in chunks))
+    else:
+        recom_rules = create_rule_index(fn_recom_rules, vocab)
+        results = (recommend_chunk(chunk, recom_rules, return_results, top_n, aggregation, vocab)
+            for chunk in chunks)
+    try:
+        for chunk_results in results:
+            for line, recomm in chunk_results:
+                fd.write(line)
+                fd.write("\n")
+                if return_results:
+                    recomms.append(recomm)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        fd.close()
     return recomms
 
 
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+########################################################################
+#
+# Copyright (c) 2018 Wan Li. All Rights Reserved
+#
+########################################################################
+
+"""
+File: recomm_service.py
+Author: Wan Li
+Date: 2018/06/19 17:05:44
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import recomm
+
+def get_rules_mtime(fn_recom_rules):
+    """
+        Last modification of a rules csv, or of any file in a binary rule store
+    """
+    if os.path.isdir(fn_recom_rules):
+        mtimes = [os.path.getmtime(os.path.join(fn_recom_rules, fn)) \
+                  for fn in os.listdir(fn_recom_rules)]
+        return max(mtimes) if len(mtimes) > 0 else None
+    return os.path.getmtime(fn_recom_rules)
+
+class OnlineRecommender:
+    """
+        Long lived recommender over an in-memory RuleIndex
+
+        A reload builds the new index aside and swaps the reference in one
+        assignment, requests already running keep the index they started with.
+        Rules should be replaced by writing a new file and renaming it over the
+        old one; a file still changing while read is skipped until next check.
+    """
+    def __init__(self, fn_recom_rules, check_interval=5.0, latency_window=10000):
+        self.fn_recom_rules = fn_recom_rules
+        self.check_interval = check_interval
+        self.rule_index = None
+        self.mtime = None
+        self.latencies = deque(maxlen=latency_window) # seconds of recent requests
+        self.latency_lock = threading.Lock()
+        self.reload_lock = threading.Lock()
+        self.watcher = None
+        self.stopped = threading.Event()
+        self.reload(force=True)
+
+    def reload(self, force=False):
+        """
+            Rebuild the rule index if the rules changed
+
+            Return:
+                whether a new index was swapped in
+        """
+        with self.reload_lock:
+            mtime = get_rules_mtime(self.fn_recom_rules)
+            if not force and mtime == self.mtime:
+                return False
+            rule_index = recomm.create_rule_index(self.fn_recom_rules)
+            if get_rules_mtime(self.fn_recom_rules) != mtime:
+                # rules rewritten while reading, keep serving the old index
+                return False
+            self.rule_index = rule_index
+            self.mtime = mtime
+            return True
+
+    def watch(self):
+        while not self.stopped.wait(self.check_interval):
+            try:
+                self.reload()
+            except (IOError, OSError, ValueError, IndexError) as e:
+                sys.stderr.write("reload failed: {}\n".format(e))
+
+    def start_watcher(self):
+        """
+            Poll the rules for changes in a daemon thread
+        """
+        if self.watcher is None:
+            self.watcher = threading.Thread(target=self.watch)
+            self.watcher.daemon = True
+            self.watcher.start()
+
+    def stop_watcher(self):
+        self.stopped.set()
+        if self.watcher is not None:
+            self.watcher.join()
+            self.watcher = None
+
+    def recommend(self, sids, top_n=10, aggregation="max"):
+        """
+            Make top_n recomm of unowned consequent items for single user
+
+            Params:
+                aggregation: "max", "sum" or "noisy_or" over matching rules
+            Return:
+                list of (sid, score, reason sids) by descending score
+        """
+        time_s = time.perf_counter()
+        rule_index = self.rule_index
+        recoms, reason = recomm.score_recom(frozenset(sids), rule_index, top_n, aggregation)
+        result = [(sid, score, tuple(sorted(reason[sid]))) for sid, score in recoms.items()]
+        latency = time.perf_counter() - time_s
+        with self.latency_lock:
+            self.latencies.append(latency)
+        return result
+
+    def latency_stats(self):
+        """
+            p50/p99 latency in milliseconds over the recent requests
+        """
+        with self.latency_lock:
+            latencies = sorted(self.latencies)
+        def percentile(p):
+            if len(latencies) == 0:
+                return None
+            return 1000.0 * latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+        return {"count": len(latencies), "p50_ms": percentile(0.5), "p99_ms": percentile(0.99),
+                "rules": len(self.rule_index)}
+
+def create_handler(recommender):
+    class RecommHandler(BaseHTTPRequestHandler):
+        """
+            GET /recommend?sids=a|b|c&top_n=10&aggregation=max, GET /stats
+        """
+        def send_json(self, code, obj):
+            body = json.dumps(obj, ensure_ascii=False).encode('utf-8')
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            if url.path == "/recommend":
+                sids = [sid for sid in query.get("sids", [""])[0].split('|') if sid != ""]
+                try:
+                    top_n = int(query.get("top_n", ["10"])[0])
+                except ValueError:
+                    self.send_json(400, {"error": "top_n must be an int"})
+                    return
+                aggregation = query.get("aggregation", ["max"])[0]
+                if aggregation not in recomm.AGGREGATIONS:
+                    self.send_json(400, {"error": "unknown aggregation: {}".format(aggregation)})
+                    return
+                recoms = recommender.recommend(sids, top_n, aggregation)
+                self.send_json(200, {"recoms": [{"sid": sid, "score": score, "reason": list(r)} \
+                                                for sid, score, r in recoms]})
+            elif url.path == "/stats":
+                self.send_json(200, recommender.latency_stats())
+            else:
+                self.send_json(404, {"error": "not found"})
+
+        def log_message(self, format, *args):
+            pass
+    return RecommHandler
+
+def serve(recommender, host="127.0.0.1", port=8080):
+    """
+        Serve recommender over local HTTP until interrupted
+    """
+    recommender.start_watcher()
+    server = ThreadingHTTPServer((host, port), create_handler(recommender))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        recommender.stop_watcher()
+
+
+if __name__ == "__main__":
+    fn_rules = sys.argv[1] if len(sys.argv) > 1 else 'out_recom_rules.csv'
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8080
+    serve(OnlineRecommender(fn_rules), port=port)
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+########################################################################
+#
+# Copyright (c) 2018 Wan Li. All Rights Reserved
+#
+########################################################################
+
+"""
+File: sampling.py
+Author: Wan Li
+Date: 2018/07/05 16:52:08
+"""
+
+import math
+import random
+import apriori as ap
+import fup
+
+def compute_sample_size(epsilon, delta=0.05):
+    """
+        Sample size bounding the support error of any one itemset
+
+        By Hoeffding, n >= ln(2 / delta) / (2 * epsilon^2) sampled actionsets
+        estimate a support fraction within epsilon with probability 1 - delta.
+    """
+    return int(math.ceil(math.log(2.0 / delta) / (2.0 * epsilon * epsilon)))
+
+class Sample:
+    """
+        Uniform sample of actionsets and the size of the data it came from
+    """
+    def __init__(self, actionsets, n_transactions, delta=0.05):
+        self.actionsets = actionsets
+        self.n_transactions = n_transactions
+        self.delta = delta
+
+    def __len__(self):
+        return len(self.actionsets)
+
+    def error(self):
+        """
+            Half width of the support fraction interval, 0 if nothing was left out
+        """
+        if len(self.actionsets) >= self.n_transactions:
+            return 0.0
+        return math.sqrt(math.log(2.0 / self.delta) / (2.0 * len(self.actionsets)))
+
+def draw_sample(data_iter, epsilon, delta=0.05, seed=None):
+    """
+        Reservoir sample in one streaming pass
+
+        Algorithm L [Li, K., 1994] draws random numbers only for actionsets
+        entering the reservoir, not for every actionset read.
+
+        Params:
+            epsilon: support fraction error, sets the sample size
+            delta: probability of an itemset exceeding the error
+    """
+    size = compute_sample_size(epsilon, delta)
+    rng = random.Random(seed)
+    reservoir = []
+    n_transactions = 0
+    w = math.exp(math.log(1.0 - rng.random()) / size)
+    next_index = size + int(math.log(1.0 - rng.random()) / math.log(1.0 - w)) if w < 1.0 else size
+    for actionset in data_iter:
+        if n_transactions < size:
+            reservoir.append(frozenset(actionset))
+        elif n_transactions == next_index:
+            reservoir[rng.randrange(size)] = frozenset(actionset)
+            w *= math.exp(math.log(1.0 - rng.random()) / size)
+            next_index += 1 + int(math.log(1.0 - rng.random()) / math.log(1.0 - w)) if w < 1.0 else 1
+        n_transactions += 1
+    return Sample(reservoir, n_transactions, delta)
+
+def compute_large_itemsets(sample, min_support, verify_data=None, engine="fp_tree"):
+    """
+        Approximate large itemsets from a sample
+
+        The sample is mined at min_support lowered by the error, so with
+        probability 1 - delta per itemset no large itemset is missed. Supports
+        are scaled to the whole data with an interval of the error either side.
+        Itemsets whose interval straddles min_support are borderline; with
+        verify_data they are counted exactly and dropped if small.
+
+        Params:
+            sample: Sample as from draw_sample, reusable across min_support
+            min_support: absolute count, or a float below 1 as fraction of the data
+            verify_data: optional callable returning an iterator over the whole data
+            engine: apriori.run engine mining the sample
+        Return:
+            dict itemset -> estimated support, dict itemset -> (low, high)
+    """
+    n_total = sample.n_transactions
+    n_sample = len(sample)
+    if n_sample == 0:
+        return {}, {}
+    min_sup = fup.compute_threshold(min_support, n_total)
+    error = sample.error()
+    sample_min_sup = max(1, int(math.ceil((float(min_sup) / n_total - error) * n_sample)))
+    large_itemsets, _ = ap.run(sample.actionsets, sample_min_sup, 0.0, engine=engine,
+        output_support_only=True)
+    support_dict = {}
+    interval_dict = {}
+    borderline = set()
+    for count, itemset in large_itemsets:
+        itemset = frozenset(itemset)
+        fraction = float(count) / n_sample
+        high = min(n_total, int(math.ceil((fraction + error) * n_total)))
+        if high < min_sup:
+            continue
+        low = max(0, int(math.floor((fraction - error) * n_total)))
+        support_dict[itemset] = int(round(fraction * n_total))
+        interval_dict[itemset] = (low, high)
+        if low < min_sup:
+            borderline.add(itemset)
+    if verify_data is not None and len(borderline) > 0:
+        count_dict = fup.count_itemsets(borderline, verify_data())
+        for itemset in borderline:
+            count = count_dict.get(itemset, 0)
+            if count < min_sup:
+                del support_dict[itemset]
+                del interval_dict[itemset]
+            else:
+                support_dict[itemset] = count
+                interval_dict[itemset] = (count, count)
+        dropped = [itemset for itemset in borderline if itemset not in support_dict]
+        # keep the result downward closed for rule generation
+        for itemset in list(support_dict.keys()):
+            if any(len(small) < len(itemset) and small.issubset(itemset) for small in dropped):
+                del support_dict[itemset]
+                del interval_dict[itemset]
+    return support_dict, interval_dict
+
+def run(data_iter, min_support, min_confidence, epsilon=0.01, delta=0.05, seed=None,
+    verify_data=None, engine="fp_tree"):
+    """
+        Preview of apriori.run from a sample
+
+        Return:
+            list of (estimated support, itemset), list of (confidence, rule),
+            dict itemset -> (low, high) support interval
+    """
+    sample = draw_sample(data_iter, epsilon, delta, seed)
+    support_dict, interval_dict = compute_large_itemsets(sample, min_support,
+        verify_data=verify_data, engine=engine)
+    large_itemsets_with_support = [(support, tuple(itemset)) for itemset, support in support_dict.items()]
+    rules = list(ap.generate_recom_rules(support_dict, min_confidence))
+    return large_itemsets_with_support, rules, interval_dict
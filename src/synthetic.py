@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+########################################################################
+#
+# Copyright (c) 2018 Wan Li. All Rights Reserved
+#
+########################################################################
+
+"""
+File: synthetic.py
+Author: Wan Li
+Date: 2018/06/21 10:12:37
+"""
+
+import numpy as np
+
+def create_patterns(n_items, n_patterns, avg_pattern_len, correlation, corruption, rng):
+    """
+        Potentially large itemsets of the IBM Quest generator [Agrawal, R., et al., 1994]
+
+        Each pattern takes an exponentially distributed fraction (mean correlation)
+        of its items from the previous pattern, the rest are picked at random.
+
+        Return:
+            list of item id tuples, normalized weights, corruption levels
+    """
+    patterns = []
+    for i in range(n_patterns):
+        size = min(n_items, max(1, rng.poisson(avg_pattern_len - 1) + 1))
+        items = set()
+        if len(patterns) > 0:
+            fraction = min(1.0, rng.exponential(correlation))
+            prev = patterns[-1]
+            n_prev = min(len(prev), int(round(fraction * size)))
+            items.update(rng.choice(prev, n_prev, replace=False).tolist())
+        while len(items) < size:
+            items.add(int(rng.randint(n_items)))
+        patterns.append(tuple(sorted(items)))
+    weights = rng.exponential(1.0, n_patterns)
+    weights /= weights.sum()
+    corruptions = np.clip(rng.normal(corruption, 0.1, n_patterns), 0.0, 1.0)
+    return patterns, weights, corruptions
+
+def yield_transactions(n_transactions, avg_len, n_items, n_patterns=None, avg_pattern_len=4,
+    correlation=0.5, corruption=0.5, seed=0):
+    """
+        Synthetic transactions of correlated patterns
+
+        A transaction of Poisson size, at most the number of items patterns
+        hold, is filled with weighted random patterns. Random items of a
+        pattern are dropped one at a time, keeping at least one, while a
+        uniform draw is below its corruption level. A pattern overflowing the
+        transaction goes into it half of the time, otherwise it starts the
+        next one. A pattern adding no new item ends the transaction.
+
+        Params:
+            n_transactions: transactions to generate
+            avg_len: mean transaction length
+            n_items: item cardinality
+            n_patterns: number of patterns, defaults to n_items // 10
+            avg_pattern_len: mean pattern length
+            seed: transactions are reproducible for a given seed
+        Yield:
+            frozenset of item names 'i<id>'
+    """
+    rng = np.random.RandomState(seed)
+    if n_patterns is None:
+        n_patterns = max(1, n_items // 10)
+    patterns, weights, corruptions = create_patterns(n_items, n_patterns, avg_pattern_len,
+        correlation, corruption, rng)
+    names = ['i' + str(i) for i in range(n_items)]
+    n_reachable = len(set().union(*patterns))
+    pending = None
+    for t in range(n_transactions):
+        size = min(n_reachable, max(1, rng.poisson(avg_len)))
+        items = set()
+        while len(items) < size:
+            if pending is not None:
+                pattern, pending = pending, None
+            else:
+                p = rng.choice(n_patterns, p=weights)
+                pattern = list(patterns[p])
+                while len(pattern) > 1 and rng.uniform() < corruptions[p]:
+                    pattern.pop(rng.randint(len(pattern)))
+            if len(items) + len(pattern) > size and len(items) > 0 and rng.uniform() < 0.5:
+                pending = pattern
+                break
+            if items.issuperset(pattern):
+                break
+            items.update(pattern)
+        yield frozenset([names[item] for item in items])
+
+def generate(fn, n_transactions, avg_len, n_items, **kwargs):
+    """
+        Write synthetic transactions to fn as uid,sid|sid|... lines
+
+        Params:
+            kwargs: passed to yield_transactions
+        Return:
+            number of lines written
+    """
+    fd = open(fn, 'w')
+    count = 0
+    for actionset in yield_transactions(n_transactions, avg_len, n_items, **kwargs):
+        fd.write('u' + str(count) + ',')
+        fd.write('|'.join(sorted(actionset)))
+        fd.write('\n')
+        count += 1
+    fd.close()
+    return count
+
+
+if __name__ == "__main__":
+    generate('uid_sids_synthetic.txt', 10000, 10, 1000)
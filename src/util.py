@@ -32,10 +32,9 @@ def create_itemset_from_iterator(data_iter):
     return itemset
 
 def yield_itemsets_from_file(fn):
-    fd = open(fn, 'r')
-    for line in fd:
-        yield set(line.rstrip().split(','))
-    fd.close()
+    with open(fn, 'r') as fd:
+        for line in fd:
+            yield set(line.rstrip().split(','))
 
 def create_itemset_from_dataframe(df):
     itemset = set()
@@ -53,104 +52,173 @@ def create_onehot_vector(itemset):
         itemvec_dict[items[i]] = itemmat.getrow(i)
     return itemvec_dict
 
-def yield_actionsets_from_file(fn):
-    fd = open(fn, "r")
-    for line in fd:
-        yield frozenset(line.rstrip().split(',')[1].split('|'))
-    fd.close()
+def yield_actionsets_from_file(fn, vocab=None):
+    """
+        Params:
+            vocab: optional item_vocab.ItemVocab, yields int encoded actionsets
+    """
+    with open(fn, "r") as fd:
+        for line in fd:
+            actionset = frozenset(line.rstrip().split(',')[1].split('|'))
+            if vocab is not None:
+                actionset = vocab.encode(actionset)
+            yield actionset
 
-def create_user_item_matrix(user_action_sets, uservec_dict, itemvec_dict, mimic="SVD++"):
+def stack_vectors(vec_dict, keys):
     """
-        Create factorization machine's data format
+        Stack the 1xN sparse vectors of keys into one CSR matrix, row i is keys[i]
+    """
+    if len(keys) == 0:
+        width = next(iter(vec_dict.values())).shape[1] if len(vec_dict) > 0 else 0
+        return sparse.csr_matrix((0, width))
+    return sparse.vstack([vec_dict[k] for k in keys], format='csr')
 
-        Params:
-            user_action_sets: array of tuple (uid, actionset)
+def create_user_history(user_action_sets, item_rows):
     """
-    mat = None
+        Per user history as CSR index arrays, duplicated items are kept
+
+        Return:
+            uids, indptr, indices into item rows
+    """
+    uids = []
+    hist_indptr = [0]
+    hist_indices = []
     for uid, items in user_action_sets:
-        vu = uservec_dict[index]
-        vi_sum = None
-        if mimic != "MF":
-            for item_name in items:
-                if item_name is np.nan:
-                    continue
-                vi = itemvec_dict[item_name]
-                if vi_sum is None:
-                    vi_sum = vi
-                else:
-                    vi_sum += vi
-        if mimic == "SVD++":
-            vi_sum /= np.sqrt(np.sum(vi_sum))
+        uids.append(uid)
         for item_name in items:
             if item_name is np.nan:
                 continue
-            vi = itemvec_dict[item_name]
-            if mimic == "SVD++":
-                vuil = sparse.hstack((vu, vi, vi_sum))
-            elif mimic == "MF":
-                vuil = sparse.hstack((vu, vi))
-            if mat is None:
-                mat = vuil
-            else:
-                mat = sparse.vstack((mat, vuil))
-    return mat
+            hist_indices.append(item_rows[item_name])
+        hist_indptr.append(len(hist_indices))
+    return uids, np.asarray(hist_indptr, dtype=np.int64), np.asarray(hist_indices, dtype=np.int64)
+
+def create_implicit_matrix(hist_indptr, hist_indices, item_mat):
+    """
+        SVD++ implicit feedback, row u is vi_sum / sqrt(sum(vi_sum)) of user u
+    """
+    hist = sparse.csr_matrix((np.ones(len(hist_indices)), hist_indices, hist_indptr),
+                             shape=(len(hist_indptr) - 1, item_mat.shape[0]))
+    vi_sum = sparse.csr_matrix(hist.dot(item_mat))
+    norms = np.sqrt(np.asarray(vi_sum.sum(axis=1)).ravel())
+    vi_sum.data = vi_sum.data / np.repeat(norms, np.diff(vi_sum.indptr))
+    return vi_sum
+
+def create_design_matrix(user_action_sets, uservec_dict, itemvec_dict, mimic="SVD++", predict_items=None):
+    """
+        Create factorization machine's data format in one shot
+
+        Row index arrays are computed once and every block is gathered from
+        stacked user/item matrices, instead of hstack/vstack per row.
+
+        Params:
+            user_action_sets: iterable of tuple (uid, actionset)
+            mimic: "SVD++" rows are [vu, vi, vi_sum / sqrt(sum(vi_sum))], "MF" rows are [vu, vi]
+            predict_items: items paired with every user, None pairs users with their own items
+        Return:
+            CSR matrix
+    """
+    if mimic not in ("SVD++", "MF"):
+        raise ValueError("unknown mimic: {}".format(mimic))
+    item_names = list(itemvec_dict.keys())
+    item_rows = dict((name, i) for i, name in enumerate(item_names))
+    item_mat = stack_vectors(itemvec_dict, item_names)
+    uids, hist_indptr, hist_indices = create_user_history(user_action_sets, item_rows)
+    user_mat = stack_vectors(uservec_dict, uids)
+    if predict_items is None:
+        row_user = np.repeat(np.arange(len(uids)), np.diff(hist_indptr))
+        row_item = hist_indices
+    else:
+        candidates = np.asarray([item_rows[item_name] for item_name in predict_items \
+                                 if item_name is not np.nan], dtype=np.int64)
+        row_user = np.repeat(np.arange(len(uids)), len(candidates))
+        row_item = np.tile(candidates, len(uids))
+    blocks = [user_mat[row_user], item_mat[row_item]]
+    if mimic == "SVD++":
+        blocks.append(create_implicit_matrix(hist_indptr, hist_indices, item_mat)[row_user])
+    return sparse.hstack(blocks, format='csr')
+
+def create_user_item_matrix(user_action_sets, uservec_dict, itemvec_dict, mimic="SVD++"):
+    """
+        Create factorization machine's data format
+
+        Params:
+            user_action_sets: array of tuple (uid, actionset)
+    """
+    return create_design_matrix(user_action_sets, uservec_dict, itemvec_dict, mimic=mimic)
 
 def create_user_item_matrix_with_compact_sid(df, uservec_dict, itemvec_dict, mimic="SVD++"):
-    mat = None
-    for index, row in df.iterrows():
-        vu = uservec_dict[index]
-        vi_sum = None
-        if mimic != "MF":
-            for item_name in row['sid'].split(','):
-                if item_name is np.nan:
-                    continue
-                vi = itemvec_dict[item_name]
-                if vi_sum is None:
-                    vi_sum = vi
-                else:
-                    vi_sum += vi
-        if mimic == "SVD++":
-            vi_sum /= np.sqrt(np.sum(vi_sum))
-        for item_name in row['sid'].split(','):
-            if item_name is np.nan:
-                continue
-            vi = itemvec_dict[item_name]
-            if mimic == "SVD++":
-                vuil = sparse.hstack((vu, vi, vi_sum))
-            elif mimic == "MF":
-                vuil = sparse.hstack((vu, vi))
-            if mat is None:
-                mat = vuil
-            else:
-                mat = sparse.vstack((mat, vuil))
-    return mat
+    user_action_sets = ((index, sid.split(',')) for index, sid in df['sid'].items())
+    return create_design_matrix(user_action_sets, uservec_dict, itemvec_dict, mimic=mimic)
 
 def create_user_item_predict_matrix_with_compact_sid(uid, df_sid, uservec_dict, itemvec_dict, mimic="SVD++"):
-    mat = None
-    vu = uservec_dict[uid]
-    if True:
-        vi_sum = None
-        if mimic != "MF":
-            for item_name in df_sid.loc[uid]['sid'].split(','):
-                if item_name is np.nan:
-                    continue
-                vi = itemvec_dict[item_name]
-                if vi_sum is None:
-                    vi_sum = vi
-                else:
-                    vi_sum += vi
-        if mimic == "SVD++":
-            vi_sum /= np.sqrt(np.sum(vi_sum))
-        for item_name in itemvec_dict.keys():
-            if item_name is np.nan:
-                continue
-            vi = itemvec_dict[item_name]
-            if mimic == "SVD++":
-                vuil = sparse.hstack((vu, vi, vi_sum))
-            elif mimic == "MF":
-                vuil = sparse.hstack((vu, vi))
-            if mat is None:
-                mat = vuil
-            else:
-                mat = sparse.vstack((mat, vuil))
-    return mat
\ No newline at end of file
+    user_action_sets = [(uid, df_sid.loc[uid]['sid'].split(','))]
+    return create_design_matrix(user_action_sets, uservec_dict, itemvec_dict, mimic=mimic,
+                                predict_items=itemvec_dict.keys())
+
+
+def yield_user_item_predict_blocks(df_sid, uservec_dict, itemvec_dict, uids=None, mimic="SVD++", block_size=64):
+    """
+        Candidate rows of users x every item, block_size users at a time
+
+        The item block and every user's implicit feedback are built once,
+        each block only gathers rows from them.
+
+        Params:
+            uids: users to score, None scores every index of df_sid
+        Yield:
+            (list of uids, item names, CSR matrix of len(uids) * len(item names) rows)
+    """
+    if mimic not in ("SVD++", "MF"):
+        raise ValueError("unknown mimic: {}".format(mimic))
+    if uids is None:
+        uids = list(df_sid.index)
+    item_names = [item_name for item_name in itemvec_dict.keys() if item_name is not np.nan]
+    item_rows = dict((name, i) for i, name in enumerate(item_names))
+    item_mat = stack_vectors(itemvec_dict, item_names)
+    user_mat = stack_vectors(uservec_dict, uids)
+    implicit_mat = None
+    if mimic == "SVD++":
+        user_action_sets = ((uid, df_sid.loc[uid]['sid'].split(',')) for uid in uids)
+        _, hist_indptr, hist_indices = create_user_history(user_action_sets, item_rows)
+        implicit_mat = create_implicit_matrix(hist_indptr, hist_indices, item_mat)
+    n_items = len(item_names)
+    for start in range(0, len(uids), block_size):
+        end = min(start + block_size, len(uids))
+        row_user = np.repeat(np.arange(start, end), n_items)
+        row_item = np.tile(np.arange(n_items), end - start)
+        blocks = [user_mat[row_user], item_mat[row_item]]
+        if implicit_mat is not None:
+            blocks.append(implicit_mat[row_user])
+        yield uids[start:end], item_names, sparse.hstack(blocks, format='csr')
+
+def yield_top_n_predictions(model, df_sid, uservec_dict, itemvec_dict, n=10, uids=None, mimic="SVD++",
+                            block_size=64, exclude_owned=False):
+    """
+        Top n items per user by model.predict, scored block by block so the
+        dense users x items score matrix is never held
+
+        Params:
+            model: fitted model with predict(X), e.g. fastFM als.FMRegression
+            exclude_owned: skip items already in the user's sid list
+        Yield:
+            (uid, list of (item name, score) by descending score)
+    """
+    for block_uids, item_names, mat in yield_user_item_predict_blocks(
+            df_sid, uservec_dict, itemvec_dict, uids=uids, mimic=mimic, block_size=block_size):
+        scores = np.asarray(model.predict(mat), dtype=np.float64).reshape(len(block_uids), len(item_names))
+        if exclude_owned:
+            item_rows = dict((name, i) for i, name in enumerate(item_names))
+            for row, uid in enumerate(block_uids):
+                for item_name in df_sid.loc[uid]['sid'].split(','):
+                    if item_name in item_rows:
+                        scores[row, item_rows[item_name]] = -np.inf
+        k = min(n, len(item_names))
+        if k == 0:
+            for uid in block_uids:
+                yield uid, []
+            continue
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        for row, uid in enumerate(block_uids):
+            cols = top[row][np.argsort(-scores[row, top[row]], kind='stable')]
+            yield uid, [(item_names[col], float(scores[row, col])) for col in cols \
+                        if scores[row, col] != -np.inf]
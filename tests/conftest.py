@@ -0,0 +1,19 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+########################################################################
+#
+# Copyright (c) 2018 Wan Li. All Rights Reserved
+#
+########################################################################
+
+"""
+File: conftest.py
+Author: Wan Li
+Date: 2018/07/09 14:02:18
+"""
+
+import os
+import sys
+
+# modules in src are imported flat, as the scripts there do
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+########################################################################
+#
+# Copyright (c) 2018 Wan Li. All Rights Reserved
+#
+########################################################################
+
+"""
+File: test_freq_patt_tree.py
+Author: Wan Li
+Date: 2018/07/09 14:05:41
+"""
+
+import random
+from collections import defaultdict
+from itertools import combinations
+import pytest
+import freq_patt_tree as fp
+
+def create_baskets(n_baskets, n_items, max_len, seed):
+    rng = random.Random(seed)
+    items = ["i{:02d}".format(i) for i in range(n_items)]
+    return [frozenset(rng.sample(items, rng.randint(1, max_len))) for _ in range(n_baskets)]
+
+def brute_force(baskets, min_sup):
+    support = defaultdict(int)
+    for basket in baskets:
+        for size in range(1, len(basket) + 1):
+            for itemset in combinations(sorted(basket), size):
+                support[frozenset(itemset)] += 1
+    return dict((k, v) for k, v in support.items() if v >= min_sup)
+
+def mine(baskets, min_sup, **kwargs):
+    root, header = fp.create_tree(baskets, min_sup)
+    return fp.compute_large_itemsets(root, header, min_sup, **kwargs)
+
+@pytest.mark.parametrize("seed,min_sup", [(0, 2), (1, 3), (2, 5)])
+def test_all_itemsets_match_brute_force(seed, min_sup):
+    baskets = create_baskets(60, 14, 10, seed)
+    assert dict(mine(baskets, min_sup)) == brute_force(baskets, min_sup)
+
+@pytest.mark.parametrize("seed,min_sup", [(3, 2), (4, 3)])
+def test_single_path_order_matches_conditional_trees(seed, min_sup, monkeypatch):
+    # nested baskets make single path conditional trees at every level
+    rng = random.Random(seed)
+    chain = ["c{:02d}".format(i) for i in range(12)]
+    baskets = [frozenset(chain[:rng.randint(1, len(chain))]) for _ in range(30)]
+    baskets += create_baskets(20, 8, 5, seed)
+    shortcut = list(mine(baskets, min_sup).items())
+    monkeypatch.setattr(fp.FPTree, "is_single_path", lambda tree: False)
+    assert shortcut == list(mine(baskets, min_sup).items())
+    assert dict(shortcut) == brute_force(baskets, min_sup)
+
+def test_cached_prefix_paths_match_brute_force(monkeypatch):
+    # cache every path longer than one item, so shared and segment paths both occur
+    monkeypatch.setattr(fp, "SHORT_PATH_LEN", 1)
+    baskets = create_baskets(80, 16, 12, 5)
+    baskets.append(frozenset(["i{:02d}".format(i) for i in range(16)]))
+    cached = list(mine(baskets, 3).items())
+    monkeypatch.setattr(fp, "SHORT_PATH_LEN", 1000)
+    assert cached == list(mine(baskets, 3).items())
+    assert dict(cached) == brute_force(baskets, 3)
+
+@pytest.mark.parametrize("mode,filter_func", [("closed", fp.filter_closed), ("maximal", fp.filter_maximal)])
+def test_modes_match_filtered_brute_force(mode, filter_func):
+    baskets = create_baskets(60, 12, 9, 6)
+    expected = dict(filter_func(brute_force(baskets, 3)))
+    assert dict(mine(baskets, 3, mode=mode)) == expected
@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+########################################################################
+#
+# Copyright (c) 2018 Wan Li. All Rights Reserved
+#
+########################################################################
+
+"""
+File: test_instrument.py
+Author: Wan Li
+Date: 2018/07/10 14:20:53
+"""
+
+import apriori as ap
+import instrument
+
+ACTIONSETS = [frozenset(["a", "b"]), frozenset(["a", "b", "c"]), frozenset(["a", "c"])]
+
+def test_phases_recorded():
+    inst = instrument.Instrument()
+    ap.run(ACTIONSETS, 1, 0.1, engine="apriori", instrumentation=inst)
+    assert "seed" in inst.to_dict()["timers"]
+    assert inst.to_dict()["peak_rss_kb"]
+
+def test_runs_without_resource(monkeypatch):
+    monkeypatch.setattr(instrument, "resource", None)
+    assert instrument.get_peak_rss_kb() is None
+    inst = instrument.Instrument()
+    itemsets, rules = ap.run(ACTIONSETS, 1, 0.1, engine="apriori", instrumentation=inst)
+    assert len(itemsets) > 0
+    assert inst.to_dict()["peak_rss_kb"] == {}
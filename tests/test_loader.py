@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+########################################################################
+#
+# Copyright (c) 2018 Wan Li. All Rights Reserved
+#
+########################################################################
+
+"""
+File: test_loader.py
+Author: Wan Li
+Date: 2018/07/10 11:40:16
+"""
+
+import pytest
+import item_vocab
+import loader
+
+def write(tmpdir, text, name="data.txt"):
+    fn = tmpdir.join(name)
+    fn.write(text)
+    return str(fn)
+
+@pytest.mark.parametrize("text,fmt", [
+    ("u1,a\nu2,c|d\n", loader.UID_SIDS),
+    ("u1,a|b\nu2,c\n", loader.UID_SIDS),
+    ("a,b,c\na,b\n", loader.BASKET),
+    ("a,b\nc\n", loader.BASKET),
+    ("a,b,\nc,d,e,\n", loader.BASKET),
+    ("", loader.BASKET)])
+def test_detect_format(tmpdir, text, fmt):
+    assert loader.detect_format(write(tmpdir, text)) == fmt
+
+@pytest.mark.parametrize("text", ["u1,a\nu2,b\n", "u1,a|b\nc,d,e\n"])
+def test_detect_format_raises_when_unsure(tmpdir, text):
+    with pytest.raises(ValueError):
+        loader.detect_format(write(tmpdir, text))
+
+def test_single_sid_first_user_loads_uids(tmpdir):
+    transactions = loader.load(write(tmpdir, "u1,a\nu2,c|d\n"))
+    assert transactions.uids == ["u1", "u2"]
+    assert list(transactions) == [frozenset(["a"]), frozenset(["c", "d"])]
+
+def load_arrays(fn, cache_dir, names):
+    vocab = item_vocab.ItemVocab(names)
+    transactions = loader.load(fn, cache_dir=cache_dir, vocab=vocab)
+    return transactions.indptr.tolist(), transactions.indices.tolist(), list(vocab.names)
+
+@pytest.mark.parametrize("names", [None, ["a"], ["d", "b"]])
+def test_cache_loads_as_file(tmpdir, names):
+    fn = write(tmpdir, "u1,b|a\nu2,c|a|d\nu3,d|c\nu4,c\n")
+    cache_dir = str(tmpdir.join("cache"))
+    expected = load_arrays(fn, None, names)
+    for indptr, indices, vocab_names in (load_arrays(fn, cache_dir, names), load_arrays(fn, cache_dir, names)):
+        assert (indptr, indices, vocab_names) == expected
+        for start, end in zip(indptr, indptr[1:]):
+            assert indices[start:end] == sorted(indices[start:end])
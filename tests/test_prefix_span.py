@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+########################################################################
+#
+# Copyright (c) 2018 Wan Li. All Rights Reserved
+#
+########################################################################
+
+"""
+File: test_prefix_span.py
+Author: Wan Li
+Date: 2018/07/09 15:31:07
+"""
+
+import datetime
+import random
+from collections import defaultdict
+from itertools import combinations
+import pytest
+import prefix_span
+
+def create_sequences(n_sequences, n_items, max_len, rng):
+    items = "abcdefghij"[:n_items]
+    return [tuple(rng.choice(items) for _ in range(rng.randint(1, max_len))) for _ in range(n_sequences)]
+
+def brute_force(sequences, min_sup, max_gap=None, max_pattern_len=None):
+    support = defaultdict(int)
+    for sequence in sequences:
+        patterns = set()
+        max_len = len(sequence) if max_pattern_len is None else min(len(sequence), max_pattern_len)
+        for size in range(1, max_len + 1):
+            for offsets in combinations(range(len(sequence)), size):
+                if max_gap is not None and any(b - a > max_gap for a, b in zip(offsets, offsets[1:])):
+                    continue
+                patterns.add(tuple(sequence[i] for i in offsets))
+        for pattern in patterns:
+            support[pattern] += 1
+    return dict((k, v) for k, v in support.items() if v >= min_sup)
+
+@pytest.mark.parametrize("max_gap", [None, 1, 2, 3])
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_patterns_match_brute_force(seed, max_gap):
+    sequences = create_sequences(40, 5, 8, random.Random(seed))
+    patterns = prefix_span.compute_sequential_patterns(sequences, 4, max_gap=max_gap)
+    assert patterns == brute_force(sequences, 4, max_gap)
+
+@pytest.mark.parametrize("max_gap", [None, 2])
+def test_max_pattern_len_matches_brute_force(max_gap):
+    sequences = create_sequences(40, 5, 8, random.Random(3))
+    patterns = prefix_span.compute_sequential_patterns(sequences, 3, max_gap=max_gap, max_pattern_len=3)
+    assert patterns == brute_force(sequences, 3, max_gap, 3)
+
+@pytest.mark.parametrize("max_gap", [None, 2])
+def test_sliding_window_matches_full_mining(max_gap):
+    rng = random.Random(4)
+    first_day = datetime.date(2018, 7, 1)
+    days = []
+    for i in range(8):
+        date = (first_day + datetime.timedelta(days=i)).strftime(prefix_span.DATE_FORMAT)
+        days.append((date, create_sequences(rng.randint(3, 8), 4, 6, rng)))
+    window = prefix_span.SlidingWindow(3, 0.3, max_gap=max_gap)
+    for i, (date, sequences) in enumerate(days):
+        in_window = [sequence for _, day in days[max(0, i - 2):i + 1] for sequence in day]
+        expected = prefix_span.compute_sequential_patterns(in_window, 0.3, max_gap=max_gap)
+        assert window.add_day(date, sequences) == expected
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+########################################################################
+#
+# Copyright (c) 2018 Wan Li. All Rights Reserved
+#
+########################################################################
+
+"""
+File: test_recomm.py
+Author: Wan Li
+Date: 2018/07/09 16:48:52
+"""
+
+import random
+from collections import defaultdict
+import pytest
+import recomm
+
+ITEMS = ["s{}".format(i) for i in range(10)]
+
+def create_rules(n_rules, rng):
+    # few distinct confidences, so many rules tie
+    rules = []
+    for _ in range(n_rules):
+        base = frozenset(rng.sample(ITEMS[:6], rng.randint(1, 2)))
+        recom = frozenset(rng.sample(ITEMS, rng.randint(1, 3))) - base
+        if len(recom) > 0:
+            rules.append((rng.choice([0.3, 0.5, 0.5, 0.8, 0.8]), base, recom))
+    return rules
+
+def brute_force(sids, rules, top_n, aggregation):
+    confidences = defaultdict(list)
+    for c, b, r in rules:
+        if b.issubset(sids):
+            for sid in r - sids:
+                confidences[sid].append(c)
+    scores = {}
+    for sid, cs in confidences.items():
+        if aggregation == "max":
+            scores[sid] = max(cs)
+        elif aggregation == "sum":
+            scores[sid] = sum(cs)
+        else:
+            no_fire = 1.0
+            for c in cs:
+                no_fire *= 1.0 - c
+            scores[sid] = 1.0 - no_fire
+    top = sorted(scores.items(), key=lambda x: (-x[1], x[0]))[:top_n]
+    return [(sid, round(score, 2)) for sid, score in top], confidences
+
+@pytest.mark.parametrize("top_n", [1, 2, 3, 5, 20])
+@pytest.mark.parametrize("aggregation", recomm.AGGREGATIONS)
+def test_score_recom_matches_brute_force(aggregation, top_n):
+    rng = random.Random(top_n)
+    rules = create_rules(60, rng)
+    index = recomm.RuleIndex(rules)
+    for _ in range(50):
+        sids = frozenset(rng.sample(ITEMS, rng.randint(1, 5)))
+        expected, confidences = brute_force(sids, rules, top_n, aggregation)
+        for recom_rules in (rules, index):
+            recoms, reason = recomm.score_recom(sids, recom_rules, top_n, aggregation)
+            assert list(recoms.items()) == expected
+            for sid, base in reason.items():
+                # the reason is one of the strongest rules recommending sid
+                assert any(c == max(confidences[sid]) and b == base and sid in r
+                    for c, b, r in rules if b.issubset(sids))
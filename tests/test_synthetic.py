@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+########################################################################
+#
+# Copyright (c) 2018 Wan Li. All Rights Reserved
+#
+########################################################################
+
+"""
+File: test_synthetic.py
+Author: Wan Li
+Date: 2018/07/10 09:12:25
+"""
+
+import pytest
+import synthetic
+
+@pytest.mark.parametrize("avg_len,n_items,corruption", [(10, 20, 0.5), (50, 5, 0.5), (3, 1, 0.5),
+    (10, 20, 1.0), (10, 20, 0.0)])
+def test_small_item_counts_terminate(avg_len, n_items, corruption):
+    names = set('i' + str(i) for i in range(n_items))
+    transactions = list(synthetic.yield_transactions(200, avg_len, n_items, corruption=corruption))
+    assert len(transactions) == 200
+    for items in transactions:
+        assert 0 < len(items) <= n_items
+        assert items.issubset(names)
+
+def test_seed_reproducible():
+    assert list(synthetic.yield_transactions(50, 5, 100, seed=3)) == \
+        list(synthetic.yield_transactions(50, 5, 100, seed=3))
+
+def test_mean_length_near_avg_len():
+    transactions = list(synthetic.yield_transactions(5000, 10, 1000))
+    mean_len = sum(len(items) for items in transactions) / float(len(transactions))
+    assert 8 < mean_len < 12